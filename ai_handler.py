@@ -1,18 +1,108 @@
 import json
 import os
+import queue
+import re
+import threading
+import time
 
 import requests
-from dotenv import load_dotenv
 
-load_dotenv()
+import cassette
+from circuit_breaker import guarded_request
+from model_stats import ModelStats
+from prompt_builder import DEFAULT_PROMPT_TOKEN_BUDGET, build_user_message, estimate_tokens
+
+# Never let a single completion hang the run
+REQUEST_TIMEOUT_SECONDS = 60
+# Hedge delay used until a model has enough latency samples for its own p90
+DEFAULT_HEDGE_SECONDS = 10
+
+
+def _parse_model_timeouts(value):
+    """Parse "model:seconds,model:seconds" into a dict, ignoring invalid entries."""
+    timeouts = {}
+    for part in (value or "").split(","):
+        name, _, seconds = part.partition(":")
+        try:
+            timeouts[name.strip()] = float(seconds)
+        except ValueError:
+            continue
+    return timeouts
+
 
 class AIHandler:
-    def __init__(self):
+    def __init__(self, stats_file='ai_model_stats.json'):
         self.api_key = os.getenv("AI_API_KEY")
         self.model = os.getenv("AI_MODEL", "sonar")
+        # Ordered model list for fallback/hedging; the first model is the primary
+        models = [m.strip() for m in os.getenv("AI_MODELS", "").split(",") if m.strip()]
+        self.models = models or [self.model]
+        self.model = self.models[0]
+        self.timeouts = _parse_model_timeouts(os.getenv("AI_MODEL_TIMEOUTS"))
+        self.hedge_seconds = DEFAULT_HEDGE_SECONDS
+        try:
+            self.hedge_seconds = float(os.getenv("AI_HEDGE_SECONDS", DEFAULT_HEDGE_SECONDS))
+        except ValueError:
+            print(f"Invalid AI_HEDGE_SECONDS value; using {DEFAULT_HEDGE_SECONDS}")
+        self.prompt_budget = DEFAULT_PROMPT_TOKEN_BUDGET
+        try:
+            self.prompt_budget = int(os.getenv("AI_PROMPT_TOKEN_BUDGET", DEFAULT_PROMPT_TOKEN_BUDGET))
+        except ValueError:
+            print(f"Invalid AI_PROMPT_TOKEN_BUDGET value; using {DEFAULT_PROMPT_TOKEN_BUDGET}")
         self.url = "https://api.perplexity.ai/chat/completions"
+        self.stats = ModelStats(stats_file)
+        # Token usage of the last reply (and totals for this run), as reported by the API
+        self.last_usage = None
+        self.total_usage = {"prompt_tokens": 0, "completion_tokens": 0}
+
+    def _hedge_delay(self, model):
+        """Seconds to wait for model before firing the next one: its observed p90 latency."""
+        p90 = self.stats.p90(model)
+        return p90 if p90 is not None else self.hedge_seconds
+
+    def _complete(self, model, messages, headers, session):
+        """Request one completion from model; returns (cleaned reply or None, reported usage)."""
+        payload = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": 200,
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "stream": False
+        }
+        start = time.perf_counter()
+        usage = {}
+        try:
+            response = guarded_request(
+                session, 'POST', self.url, json=payload, headers=headers,
+                timeout=self.timeouts.get(model, REQUEST_TIMEOUT_SECONDS)
+            )
+            if response.status_code != 200:
+                print(f"Perplexity API Error ({model}): {response.status_code} - {response.text}")
+            response.raise_for_status()
+            data = response.json()
+            usage = data.get('usage') or {}
+            reply = _clean_reply(data['choices'][0]['message']['content'])
+        except Exception as e:
+            print(f"Exception during Perplexity reply generation ({model}): {e}")
+            reply = None
+        latency = time.perf_counter() - start
+        self.stats.record(model, latency, success=bool(reply), usage=usage)
+        return reply, dict(usage, model=model, latency=round(latency, 3))
+
+    def _complete_in_thread(self, model, messages, headers, results):
+        """Run _complete on a session of its own and put (model, reply, usage) on results."""
+        session = cassette.install(requests.Session())
+        try:
+            outcome = self._complete(model, messages, headers, session)
+        except Exception as e:
+            print(f"Unexpected error while asking {model}: {e}")
+            outcome = (None, {"model": model})
+        finally:
+            session.close()
+        results.put((model,) + tuple(outcome))
 
-    def generate_reply(self, post_content, post_title=""):
+    def generate_reply(self, post_content, post_title="", avoid_replies=None):
         """
         Generates a human-like reply using Perplexity API.
         Optimized for forum interaction and anti-detection.
@@ -20,6 +110,7 @@ class AIHandler:
         Args:
             post_content: The main content/message of the post
             post_title: The title of the post (optional but recommended)
+            avoid_replies: Earlier replies the new reply must not resemble (optional)
         """
         if not self.api_key:
             return "Error: AI_API_KEY is missing."
@@ -44,44 +135,86 @@ class AIHandler:
             "Content-Type": "application/json"
         }
         
-        # Construct user message with both title and content
-        if post_title and post_title.strip():
-            user_message = f"帖子標題：{post_title}\n帖子內容：{post_content}\n\n請生成回覆："
-        else:
-            user_message = f"帖子內容：{post_content}\n\n請生成回覆："
+        # Construct user message with both title and content, trimmed to the prompt budget
+        user_message = build_user_message(post_content, post_title, self.prompt_budget)
 
-        payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            "max_tokens": 200,
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "stream": False
-        }
+        # Steer away from replies we have already posted elsewhere
+        if avoid_replies:
+            previous = "\n".join(f"- {r}" for r in avoid_replies)
+            user_message += f"\n（唔好同以下之前用過嘅回覆相似，換個講法同角度：\n{previous}）"
+
+        self.last_usage = None
+        # Local estimate, reported alongside the API's own count to tune the budget
+        estimated_prompt_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_message)
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+
+        # Start with the primary model. If it has not answered within its observed p90
+        # latency, hedge with the next model; if it fails, fall back to the next model
+        # immediately. The first valid reply wins. A request that is already in flight
+        # cannot be aborted: the losing model keeps running in a daemon thread until it
+        # answers or times out, and is still billed, but the run does not wait for it.
+        # Hedging is off while replaying a cassette, so replays take the same path every time.
+        hedging = not cassette.is_replaying()
+        results = queue.Queue()
+        pending = []
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            model = self.models[next_index]
+            next_index += 1
+            pending.append(model)
+            threading.Thread(
+                target=self._complete_in_thread, args=(model, messages, headers, results), daemon=True
+            ).start()
+            return model
 
         try:
-            response = requests.post(self.url, json=payload, headers=headers)
-            if response.status_code != 200:
-                print(f"Perplexity API Error: {response.status_code} - {response.text}")
-            response.raise_for_status()
-            data = response.json()
-            reply = data['choices'][0]['message']['content'].strip()
-
-            # Post-processing: Remove [1], [2] citation markers
-            import re
-            reply = re.sub(r'\[\d+\]', '', reply)
-
-            # Remove any potential "Reply:" prefix if AI generates it
-            if reply.startswith("回覆："):
-                reply = reply.replace("回覆：", "", 1).strip()
-            
-            # Convert regular newlines to <br> tags for forum formatting
-            reply = reply.replace('\n', '<br>')
-            
-            return reply
-        except Exception as e:
-            print(f"Exception during Perplexity reply generation: {e}")
+            last_model = launch()
+            while pending:
+                can_hedge = hedging and next_index < len(self.models)
+                try:
+                    model, reply, usage = results.get(timeout=self._hedge_delay(last_model) if can_hedge else None)
+                except queue.Empty:
+                    print(f"No reply from {last_model} within its hedge delay; also asking {self.models[next_index]}")
+                    last_model = launch()
+                    continue
+                pending.remove(model)
+                if reply:
+                    self._record_usage(usage, estimated_prompt_tokens)
+                    if pending:
+                        print(f"Using reply from {model}; {pending} still running in the background (still billed)")
+                    return reply
+                if next_index < len(self.models):
+                    print(f"{model} failed; falling back to {self.models[next_index]}")
+                    last_model = launch()
             return None
+        finally:
+            self.stats.save()
+
+    def _record_usage(self, usage, estimated_prompt_tokens):
+        """Remember the winning completion's token usage and add it to the run totals."""
+        self.last_usage = dict(usage, estimated_prompt_tokens=estimated_prompt_tokens)
+        for key in self.total_usage:
+            self.total_usage[key] += usage.get(key) or 0
+
+
+def _clean_reply(reply):
+    """Post-process a raw completion into forum-ready reply text (None if empty)."""
+    reply = reply.strip()
+
+    # Post-processing: Remove [1], [2] citation markers
+    reply = re.sub(r'\[\d+\]', '', reply)
+
+    # Remove any potential "Reply:" prefix if AI generates it
+    if reply.startswith("回覆："):
+        reply = reply.replace("回覆：", "", 1).strip()
+    
+    # Convert regular newlines to <br> tags for forum formatting
+    reply = reply.replace('\n', '<br>')
+    
+    return reply or None
@@ -0,0 +1,289 @@
+import atexit
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+REDACTED = "<redacted>"
+
+# Headers whose values must never be written to a cassette
+SENSITIVE_HEADERS = {"authorization", "cookie", "set-cookie", "squareguid", "clientguid"}
+
+# URL path fragments whose response body is a secret (the login endpoint returns the bare token)
+SECRET_RESPONSE_PATHS = ("/AuthorizationService/ParticipantLogin",)
+
+# Response headers that no longer describe the stored body once it has been decoded
+_DROPPED_RESPONSE_HEADERS = {"content-encoding", "transfer-encoding", "content-length"}
+
+# File in a state snapshot holding the time it was recorded (see state_clock)
+RECORDED_AT_FILE = ".recorded_at"
+
+
+def _redact_headers(headers):
+    """Return a plain dict copy of headers with sensitive values replaced."""
+    return {
+        key: (REDACTED if key.lower() in SENSITIVE_HEADERS else value)
+        for key, value in headers.items()
+    }
+
+
+def _body_hash(body):
+    """Short digest of a (redacted) request body, used to tell apart requests to the same URL."""
+    return hashlib.sha1((body or "").encode('utf-8')).hexdigest()
+
+
+def _redact_body(body, secrets):
+    """Replace every known secret value inside a request/response body."""
+    if body is None:
+        return None
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    for secret in secrets:
+        if secret:
+            body = body.replace(secret, REDACTED)
+            # Form-encoded bodies (login) carry the URL-quoted value
+            quoted = requests.utils.quote(secret, safe='')
+            if quoted != secret:
+                body = body.replace(quoted, REDACTED)
+    return body
+
+
+class Cassette:
+    """
+    Records or replays HTTP interactions for ForumClient and AIHandler.
+
+    A cassette is a JSON Lines file with one interaction per line. Recording
+    appends as it goes so a crashed run still leaves a usable cassette.
+    Replay matches interactions by method, URL and request body in recorded
+    order, so e.g. AI completions for different posts or models are never
+    swapped; a request whose body was not recorded as such (e.g. a different
+    password in a form body) falls back to the next unused interaction for its
+    method and URL. Replay never touches the network.
+    """
+    def __init__(self, path, mode, latency="zero", secrets=()):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.secrets = [s for s in secrets if s]
+        self._lock = threading.Lock()
+        self._queues = defaultdict(deque)
+        self._body_queues = defaultdict(deque)
+
+        if mode == "record":
+            # Start every recording from an empty file
+            open(self.path, 'w', encoding='utf-8').close()
+            logger.info(f"Recording HTTP interactions to {self.path}")
+        else:
+            self._load()
+
+    def _load(self):
+        count = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                entry['_used'] = False
+                self._queues[(entry['method'], entry['url'])].append(entry)
+                self._body_queues[(entry['method'], entry['url'], _body_hash(entry.get('request_body')))].append(entry)
+                count += 1
+        logger.info(f"Replaying {count} HTTP interactions from {self.path} (latency: {self.latency})")
+
+    def add_secret(self, value):
+        """Register a value discovered at runtime (e.g. a fresh token) for redaction."""
+        if value and value not in self.secrets:
+            self.secrets.append(value)
+
+    def record(self, request, response, elapsed):
+        """Append one redacted interaction to the cassette file."""
+        if any(path in request.url for path in SECRET_RESPONSE_PATHS):
+            self.add_secret(response.text.strip())
+        entry = {
+            "method": request.method,
+            "url": _redact_body(request.url, self.secrets),
+            "request_headers": _redact_headers(request.headers),
+            "request_body": _redact_body(request.body, self.secrets),
+            "status": response.status_code,
+            "headers": {
+                k: v for k, v in _redact_headers(response.headers).items()
+                if k.lower() not in _DROPPED_RESPONSE_HEADERS
+            },
+            "body": _redact_body(response.text, self.secrets),
+            "elapsed": round(elapsed, 4),
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+    def next_interaction(self, method, url, body=None):
+        """Pop the next recorded interaction for method/URL/body, or None when exhausted."""
+        url = _redact_body(url, self.secrets)
+        body_key = (method, url, _body_hash(_redact_body(body, self.secrets)))
+        with self._lock:
+            for queue in (self._body_queues.get(body_key), self._queues.get((method, url))):
+                while queue:
+                    entry = queue.popleft()
+                    if not entry['_used']:
+                        entry['_used'] = True
+                        return entry
+            return None
+
+
+class CassetteAdapter(HTTPAdapter):
+    """Transport adapter that records real traffic or serves it back from a cassette."""
+    def __init__(self, cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        if self.cassette.mode == "replay":
+            return self._replay(request)
+
+        start = time.perf_counter()
+        response = super().send(request, **kwargs)
+        # Force the body to load so the elapsed time covers the full transfer
+        _ = response.content
+        self.cassette.record(request, response, time.perf_counter() - start)
+        return response
+
+    def _replay(self, request):
+        entry = self.cassette.next_interaction(request.method, request.url, request.body)
+        if entry is None:
+            raise requests.exceptions.ConnectionError(
+                f"No recorded interaction left for {request.method} {request.url}",
+                request=request,
+            )
+        if self.cassette.latency == "recorded":
+            time.sleep(entry.get('elapsed', 0))
+
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry.get('headers', {}))
+        response._content = (entry.get('body') or '').encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.reason = requests.status_codes._codes.get(entry['status'], ('',))[0].upper()
+        return response
+
+
+_cassette = None
+_cassette_loaded = False
+
+
+def get_cassette():
+    """
+    Return the process-wide cassette configured by CASSETTE_MODE, or None.
+
+    CASSETTE_MODE: "record" or "replay" (anything else disables cassettes)
+    CASSETTE_FILE: cassette path (default: cassette.jsonl)
+    CASSETTE_LATENCY: "zero" or "recorded" (replay only, default: zero)
+    """
+    global _cassette, _cassette_loaded
+    if _cassette_loaded:
+        return _cassette
+    _cassette_loaded = True
+
+    mode = os.getenv("CASSETTE_MODE", "").strip().lower()
+    if mode not in ("record", "replay"):
+        return None
+
+    path = os.getenv("CASSETTE_FILE", "cassette.jsonl")
+    latency = os.getenv("CASSETTE_LATENCY", "zero").strip().lower()
+    if latency not in ("zero", "recorded"):
+        logger.warning(f"Invalid CASSETTE_LATENCY '{latency}', using 'zero'")
+        latency = "zero"
+
+    secrets = [os.getenv("FORUM_PASSWORD"), os.getenv("AI_API_KEY"), os.getenv("FORUM_USERNAME")]
+    _cassette = Cassette(path, mode, latency=latency, secrets=secrets)
+    return _cassette
+
+
+def install(session):
+    """Mount the configured cassette on a requests.Session (no-op when disabled)."""
+    cassette = get_cassette()
+    if cassette is not None:
+        adapter = CassetteAdapter(cassette)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+    return session
+
+
+def state_dir(paths):
+    """
+    Directory the run's local state files (replied history, outbox, ...) should live in.
+
+    Without a cassette this is the working directory. Recording snapshots the given
+    paths (relative files, directories or glob patterns) next to the cassette
+    (<cassette>.state/) as they were before the run, together with the time of the
+    snapshot. Replaying copies that snapshot into a fresh temporary directory, so every
+    replay starts from the recorded state and never writes the real history.
+    """
+    cassette = get_cassette()
+    if cassette is None:
+        return "."
+    snapshot = f"{cassette.path}.state"
+    if cassette.mode == "record":
+        shutil.rmtree(snapshot, ignore_errors=True)
+        _copy_paths(".", snapshot, paths)
+        with open(os.path.join(snapshot, RECORDED_AT_FILE), 'w', encoding='utf-8') as f:
+            f.write(repr(time.time()))
+        return "."
+    workdir = tempfile.mkdtemp(prefix="replay-state-")
+    atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+    if os.path.isdir(snapshot):
+        _copy_paths(snapshot, workdir, paths)
+    logger.info(f"Replay state lives in {workdir}")
+    return workdir
+
+
+def _copy_paths(source, destination, paths):
+    os.makedirs(destination, exist_ok=True)
+    for pattern in paths:
+        for src in glob.glob(os.path.join(source, pattern)):
+            path = os.path.relpath(src, source)
+            if os.path.isdir(src):
+                shutil.copytree(src, os.path.join(destination, path))
+            elif os.path.isfile(src):
+                shutil.copy2(src, os.path.join(destination, path))
+
+
+def state_clock():
+    """
+    Clock for TTL decisions on the local state (e.g. the state bundle).
+
+    The wall clock, except when replaying: then the time the state snapshot was
+    recorded, so cached tokens and metadata are judged fresh or stale exactly as
+    they were during the recording, however long ago that was.
+    """
+    cassette = get_cassette()
+    if cassette is None or cassette.mode != "replay":
+        return time.time
+    try:
+        with open(os.path.join(f"{cassette.path}.state", RECORDED_AT_FILE), encoding='utf-8') as f:
+            recorded_at = float(f.read())
+    except (OSError, ValueError):
+        logger.warning("Cassette state snapshot has no recording time; using the wall clock")
+        return time.time
+    return lambda: recorded_at
+
+
+def is_replaying():
+    """True when HTTP traffic is being served from a cassette instead of the network."""
+    cassette = get_cassette()
+    return cassette is not None and cassette.mode == "replay"
@@ -0,0 +1,163 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half-open"
+
+# Status codes that mean the service (not our request) is in trouble
+FAILURE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of sending a request while a host's circuit is open."""
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header value into seconds.
+
+    Accepts either delta-seconds ("120") or an HTTP-date. Returns None if missing or invalid.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker shared by every request of a run.
+
+    Opens after `failure_threshold` consecutive failures (or immediately on a
+    Retry-After/429), fails fast while open, and after the cooldown lets a single
+    half-open probe through: success closes the circuit, failure re-opens it.
+    """
+    def __init__(self, name, failure_threshold=3, cooldown_seconds=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Raise CircuitOpenError if a request to this host must not be sent now."""
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == STATE_OPEN and now >= self.open_until:
+                logger.info(f"Circuit '{self.name}' half-open, sending probe request")
+                self.state = STATE_HALF_OPEN
+                return
+            wait = max(0.0, self.open_until - now)
+            raise CircuitOpenError(f"Circuit '{self.name}' is {self.state}; failing fast (retry in {wait:.0f}s)")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != STATE_CLOSED:
+                logger.info(f"Circuit '{self.name}' closed again")
+            self.state = STATE_CLOSED
+            self.failures = 0
+
+    def record_failure(self, retry_after=None):
+        """
+        Count a failure; open the circuit at the threshold or when the server asks us to back off.
+
+        With retry_after the circuit opens immediately for exactly that long, otherwise for the cooldown.
+        """
+        with self._lock:
+            self.failures += 1
+            if self.state == STATE_HALF_OPEN or retry_after is not None or self.failures >= self.failure_threshold:
+                pause = self.cooldown_seconds if retry_after is None else retry_after
+                self.state = STATE_OPEN
+                self.open_until = time.monotonic() + pause
+                logger.warning(
+                    f"Circuit '{self.name}' opened after {self.failures} consecutive failures "
+                    f"for {pause:.0f}s"
+                )
+
+    def seconds_until_retry(self):
+        """Seconds until the next request may be attempted (0 when closed)."""
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return 0.0
+            return max(0.0, self.open_until - time.monotonic())
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(url):
+    """
+    Return the shared breaker for the host of url, creating it on first use.
+
+    CIRCUIT_FAILURE_THRESHOLD: consecutive failures before opening (default: 3)
+    CIRCUIT_COOLDOWN_SECONDS: how long to fail fast before a probe (default: 60)
+    """
+    host = urlparse(url).netloc or url
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            try:
+                threshold = max(1, int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3")))
+            except ValueError:
+                logger.warning("Invalid CIRCUIT_FAILURE_THRESHOLD, using default: 3")
+                threshold = 3
+            try:
+                cooldown = max(0.0, float(os.getenv("CIRCUIT_COOLDOWN_SECONDS", "60")))
+            except ValueError:
+                logger.warning("Invalid CIRCUIT_COOLDOWN_SECONDS, using default: 60")
+                cooldown = 60.0
+            breaker = CircuitBreaker(host, threshold, cooldown)
+            _breakers[host] = breaker
+        return breaker
+
+
+def guarded_request(session, method, url, **kwargs):
+    """
+    Send a request through the host's circuit breaker.
+
+    Raises CircuitOpenError without touching the network while the circuit is open.
+    Connection errors, timeouts, 5xx and 429 responses count as failures; a
+    Retry-After header opens the circuit for exactly that long.
+    """
+    breaker = get_breaker(url)
+    breaker.before_request()
+    try:
+        response = session.request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        breaker.record_failure()
+        raise
+
+    if response.status_code in FAILURE_STATUS_CODES:
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if response.status_code == 429 and retry_after is None:
+            # Rate limited without a hint: back off for the full cooldown
+            retry_after = breaker.cooldown_seconds
+        breaker.record_failure(retry_after)
+    else:
+        breaker.record_success()
+    return response
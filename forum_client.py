@@ -2,9 +2,17 @@ import json
 import logging
 import os
 import time
+from dataclasses import dataclass
 
 import requests
 
+try:
+    import orjson  # optional faster JSON backend
+except ImportError:
+    orjson = None
+
+import cassette
+from circuit_breaker import CircuitOpenError, get_breaker, guarded_request
 from config_manager import ConfigManager
 from utils import get_random_headers
 
@@ -13,6 +21,67 @@ logger = logging.getLogger(__name__)
 # Retry configuration
 MAX_RETRIES = 3
 INITIAL_BACKOFF_SECONDS = 2
+# Give up instead of waiting when the server (Retry-After) or an open circuit asks for a longer pause
+MAX_RETRY_WAIT_SECONDS = 30
+# Never let a single request hang the run
+REQUEST_TIMEOUT_SECONDS = 30
+
+# Keys of a GetConversationsInRoom response that are kept when decoding; everything else is dropped
+CONVERSATION_KEYS = frozenset({
+    "Items", "Guid", "RoomGuid", "Message", "Title",
+    "Username", "ParticipantDisplayName", "CreatedByName", "IsLiked", "DatePosted",
+})
+
+
+@dataclass(slots=True)
+class Conversation:
+    """A forum conversation (post) as used by the bot."""
+    conversation_id: str  # Used as Guid/ParentMessageGuid
+    room_guid: str  # Specific room GUID for reply
+    content: str
+    title: str
+    username: str
+    is_liked: bool
+    date_posted: str  # ISO 8601 timestamp e.g. "2026-01-07T15:04:51.870Z"
+
+    @classmethod
+    def from_item(cls, item):
+        """Build a Conversation from one item of the GetConversationsInRoom response."""
+        return cls(
+            conversation_id=item["Guid"],
+            room_guid=item.get("RoomGuid"),
+            content=item.get("Message") or item.get("Title") or "",
+            title=item.get("Title") or "",
+            username=item.get("Username") or item.get("ParticipantDisplayName") or item.get("CreatedByName") or "Unknown",
+            is_liked=item.get("IsLiked", False),
+            date_posted=item.get("DatePosted") or "",
+        )
+
+    def to_dict(self):
+        """The conversation with the forum-style keys used in listings and snapshots."""
+        return {
+            "conversationID": self.conversation_id,
+            "roomGUID": self.room_guid,
+            "content": self.content,
+            "title": self.title,
+            "username": self.username,
+            "isLiked": self.is_liked,
+            "datePosted": self.date_posted,
+        }
+
+
+def _project(pairs):
+    """object_pairs_hook keeping only CONVERSATION_KEYS, so unused fields are never materialised as dicts."""
+    return {key: value for key, value in pairs if key in CONVERSATION_KEYS}
+
+
+def decode_conversations(body):
+    """Decode a GetConversationsInRoom response body (bytes) into a list of Conversation."""
+    if orjson is not None:
+        data = orjson.loads(body)
+    else:
+        data = json.loads(body, object_pairs_hook=_project)
+    return [Conversation.from_item(item) for item in (data or {}).get("Items") or []]
 
 
 def _calculate_backoff(attempt):
@@ -28,7 +97,7 @@ class ForumClient:
     """
     Implements the real 6-step forum interaction logic for HSBC Community (Square Community).
     """
-    def __init__(self, base_url, username, password):
+    def __init__(self, base_url, username, password, state=None):
         # Note: base_url is split between query and command in reality, but we can store the common part or just hardcode endpoints.
         self.query_url = "https://serviceapi-query.square-community.com.au"
         self.command_url = "https://serviceapi-command.square-community.com.au"
@@ -36,8 +105,10 @@ class ForumClient:
 
         self.username = username
         self.password = password
-        self.config = ConfigManager()
-        self.session = requests.Session()
+        # Optional StateBundle holding the token and its last validation time (see state_bundle.py)
+        self.state = state
+        self._config = None
+        self.session = cassette.install(requests.Session())
 
         # Base headers used across requests (matching actual browser headers)
         # squareguid and clientguid are platform identifiers for the HSBC Community
@@ -51,22 +122,40 @@ class ForumClient:
             'clientguid': os.getenv("CLIENT_GUID", "9b579d63-9a66-4685-9c43-f665a790a3fb")
         })
 
-        # Load token if exists
-        self.token = self.config.get("auth_token")
+        # Load token if exists (config.json is only read when the state bundle has none)
+        self.token = state.token if state is not None and state.token else self.config.get("auth_token")
         if self.token:
             self.session.headers.update({"Authorization": f"Bearer {self.token}"})
 
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = ConfigManager()
+        return self._config
+
+    def _request(self, method, url, **kwargs):
+        """Send a request through the per-host circuit breaker (fails fast while the host is down)."""
+        kwargs.setdefault('timeout', REQUEST_TIMEOUT_SECONDS)
+        return guarded_request(self.session, method, url, **kwargs)
+
     def validate_session(self):
         """Step 1: Validate Login Status."""
         logger.info("Step 1: Validating token status...")
+        if self.state is not None and self.token == self.state.token and self.state.token_recently_validated():
+            logger.info("Token was validated recently; skipping validation request.")
+            return True
         # Fixed PageGuid for validation check as per docs
         page_guid = "ca6305b6-d6cd-4940-a4d8-dc54d2f66050"
         url = f"{self.query_url}/PageService/AllowedToNavigateToPage?pageGuid={page_guid}"
 
         try:
-            response = self.session.get(url)
+            response = self._request('GET', url)
             if response.status_code == 200:
                 logger.info("Session is valid.")
+                if self.state is not None and self.token:
+                    if self.token != self.state.token:
+                        self.state.set_token(self.token)
+                    self.state.mark_token_validated()
                 return True
             logger.warning(f"Session invalid (Status: {response.status_code}).")
             return False
@@ -98,14 +187,18 @@ class ForumClient:
         }
 
         try:
-            response = self.session.post(url, data=payload)
+            response = self._request('POST', url, data=payload)
             response.raise_for_status()
 
             # Response is plain text token
             self.token = response.text
 
-            # Save and update session
-            self.config.set("auth_token", self.token)
+            # Save and update session (a replayed token is redacted, so never persist it)
+            if not cassette.is_replaying():
+                if self.state is not None:
+                    self.state.set_token(self.token)
+                else:
+                    self.config.set("auth_token", self.token)
             self.session.headers.update({"Authorization": f"Bearer {self.token}"})
             logger.info("Login successful. Token refreshed.")
             return True
@@ -119,7 +212,7 @@ class ForumClient:
         url = f"{self.query_url}/PageService/ListPageConsumer"
 
         try:
-            response = self.session.get(url)
+            response = self._request('GET', url)
             response.raise_for_status()
             data = response.json()
 
@@ -141,7 +234,7 @@ class ForumClient:
         url = f"{self.command_url}/ForumService/GetForumRooms"
 
         try:
-            response = self.session.post(url, json={"guid": page_guid})
+            response = self._request('POST', url, json={"guid": page_guid})
             response.raise_for_status()
             data = response.json()
 
@@ -177,7 +270,13 @@ class ForumClient:
             return []
 
     def get_conversations(self, room_guid, page_guid="bc7de0d9-cce3-4019-b7a9-ad8f843f320d"):
-        """Step 5: Get Conversations in Room."""
+        """
+        Step 5: Get Conversations in Room (a list of Conversation).
+
+        Returns None when the room could not be fetched (request failed, or skipped
+        while the command host's circuit is open), so callers can tell it from an
+        empty room ([]).
+        """
         logger.info(f"Step 5: Fetching conversations for room {room_guid}...")
         url = f"{self.command_url}/ForumService/GetConversationsInRoom"
         
@@ -200,30 +299,47 @@ class ForumClient:
         }
 
         try:
-            response = self.session.post(url, json=payload)
+            response = self._request('POST', url, json=payload)
             response.raise_for_status()
-            data = response.json()
-
-            conversations = []
-            for item in data.get("Items", []):
-                conversations.append({
-                    "conversationID": item["Guid"], # Used as Guid/ParentMessageGuid
-                    "roomGUID": item.get("RoomGuid"), # Specific room GUID for reply
-                    "content": item.get("Message", "") or item.get("Title", ""),
-                    "title": item.get("Title", ""),
-                    "username": item.get("Username", "") or item.get("ParticipantDisplayName", "") or item.get("CreatedByName", "Unknown"),
-                    "isLiked": item.get("IsLiked", False),
-                    "datePosted": item.get("DatePosted", "")  # ISO 8601 timestamp e.g. "2026-01-07T15:04:51.870Z"
-                })
-            return conversations
+            return decode_conversations(response.content)
+        except CircuitOpenError as e:
+            logger.warning(f"Skipping conversations of room {room_guid}: {e}")
+            return None
         except Exception as e:
             logger.error(f"Get conversations failed: {e}")
-            return []
+            return None
 
     def reply_and_like(self, room_guid, post_guid, message):
         """Step 6 & 7: Reply to conversation and Like the new reply.
         
+        Returns True only when both the reply and the like succeeded.
+        """
+        new_reply_guid = self.reply_to_conversation(room_guid, post_guid, message)
+        if not new_reply_guid:
+            return False
+        return self.like_conversation(new_reply_guid)
+
+    def _wait_before_retry(self, url, attempt):
+        """
+        Sleep before the next retry attempt.
+
+        Waits for the exponential backoff or, if longer, until the host's circuit
+        breaker allows requests again (e.g. after Retry-After). Returns False without
+        sleeping when that wait exceeds MAX_RETRY_WAIT_SECONDS.
+        """
+        backoff_time = max(_calculate_backoff(attempt), get_breaker(url).seconds_until_retry())
+        if backoff_time > MAX_RETRY_WAIT_SECONDS:
+            logger.warning(f"Server asked us to back off for {backoff_time:.0f} seconds; not retrying now")
+            return False
+        logger.info(f"Retrying in {backoff_time:.0f} seconds...")
+        time.sleep(backoff_time)
+        return True
+
+    def reply_to_conversation(self, room_guid, post_guid, message):
+        """Step 6: Reply to conversation.
+        
         Implements retry logic with exponential backoff for handling transient failures.
+        Returns the new reply's conversation GUID, or None on failure.
         """
         logger.info(f"Step 6: Replying to post {post_guid}...")
         url_reply = f"{self.command_url}/ConversationService/ReplyToConversation"
@@ -253,67 +369,47 @@ class ForumClient:
         logger.debug(f"Request payload (Guid): {post_guid}")
         logger.debug(f"Request payload (Message length): {len(message)} chars")
 
-        # Retry logic with exponential backoff
-        last_exception = None
-        
         # Save the Content-Type header value so we can restore it later
         # The reply request needs multipart/form-data (set automatically by requests when using files)
         # but the session has application/json preset which would interfere
         saved_content_type = self.session.headers.get('Content-Type')
         
         try:
+            # Remove Content-Type header so requests can set multipart/form-data with proper boundary
+            self.session.headers.pop('Content-Type', None)
+
+            # Retry logic with exponential backoff
             for attempt in range(1, MAX_RETRIES + 1):
                 try:
-                    # Remove Content-Type header so requests can set multipart/form-data with proper boundary
-                    # This needs to be done on each attempt in case it was restored for a previous like attempt
-                    self.session.headers.pop('Content-Type', None)
-                    
-                    # 1. Reply using self.session
-                    response = self.session.post(url_reply, files=files)
+                    response = self._request('POST', url_reply, files=files)
                     
                     # Log response details for debugging
                     logger.debug(f"Response status: {response.status_code}")
                     logger.debug(f"Response headers: {dict(response.headers)}")
                     
-                    # Check for server errors specifically
-                    if response.status_code >= 500:
+                    # Check for server errors and rate limiting specifically
+                    if response.status_code >= 500 or response.status_code == 429:
                         logger.warning(f"Server error {response.status_code} on attempt {attempt}/{MAX_RETRIES}")
                         logger.debug(f"Response body: {_truncate_response_body(response.text)}")
                         
-                        if attempt < MAX_RETRIES:
-                            backoff_time = _calculate_backoff(attempt)
-                            logger.info(f"Retrying in {backoff_time} seconds...")
-                            time.sleep(backoff_time)
+                        if attempt < MAX_RETRIES and self._wait_before_retry(url_reply, attempt):
                             continue
-                        else:
-                            logger.error(f"Max retries ({MAX_RETRIES}) reached for reply to post {post_guid}")
-                            return False
+                        logger.error(f"Giving up on reply to post {post_guid} after attempt {attempt}/{MAX_RETRIES}")
+                        return None
                     
                     response.raise_for_status()
                     
                     # Response is the new Conversation GUID (string)
                     new_reply_guid = response.text.replace('"', '')
                     logger.info(f"Reply successful. New GUID: {new_reply_guid}")
+                    return new_reply_guid
                     
-                    # 2. Like (Step 7)
-                    # Note: The Content-Type header will be restored in the finally block
-                    # but we need it for the JSON Like request, so restore it early here
-                    if saved_content_type:
-                        self.session.headers['Content-Type'] = saved_content_type
-                    
-                    logger.info(f"Step 7: Liking the new reply {new_reply_guid}...")
-                    url_like = f"{self.command_url}/ConversationService/LikeConversation"
-                    like_payload = {"ConversationGuid": new_reply_guid}
-                    
-                    # Use self.session for Like request as well
-                    _like_response = self.session.post(url_like, json=like_payload)
-                    _like_response.raise_for_status()
-                    logger.info("Like successful.")
+                except CircuitOpenError as e:
+                    # The command API is known to be down: do not burn the retry budget
+                    logger.error(f"Reply to post {post_guid} not sent: {e}")
+                    return None
 
-                    return True
-                    
                 except requests.exceptions.RequestException as e:
-                    last_exception = e
                     logger.warning(f"Request failed on attempt {attempt}/{MAX_RETRIES}: {e}")
                     
                     # Log additional details for debugging
@@ -321,24 +417,36 @@ class ForumClient:
                         logger.debug(f"Error response status: {e.response.status_code}")
                         logger.debug(f"Error response body: {_truncate_response_body(e.response.text)}")
                     
-                    if attempt < MAX_RETRIES:
-                        backoff_time = _calculate_backoff(attempt)
-                        logger.info(f"Retrying in {backoff_time} seconds...")
-                        time.sleep(backoff_time)
-                    else:
+                    if attempt >= MAX_RETRIES:
                         logger.error(f"Max retries ({MAX_RETRIES}) reached. Last error: {e}")
+                    elif not self._wait_before_retry(url_reply, attempt):
+                        break
                         
                 except Exception as e:
                     # Catch unexpected errors
-                    last_exception = e
                     logger.error(f"Unexpected error on attempt {attempt}/{MAX_RETRIES}: {e}")
                     if attempt >= MAX_RETRIES:
                         break
             
-            # If we exhausted all retries, log and return False
-            logger.error(f"Reply/Like failed after {MAX_RETRIES} attempts for post {post_guid}. Skipping to next post.")
-            return False
+            # If we exhausted all retries, log and return None
+            logger.error(f"Reply failed for post {post_guid}. Skipping to next post.")
+            return None
         finally:
             # Restore Content-Type header to session
             if saved_content_type:
                 self.session.headers['Content-Type'] = saved_content_type
+
+    def like_conversation(self, conversation_guid):
+        """Step 7: Like a conversation (our new reply)."""
+        logger.info(f"Step 7: Liking the new reply {conversation_guid}...")
+        url_like = f"{self.command_url}/ConversationService/LikeConversation"
+        like_payload = {"ConversationGuid": conversation_guid}
+
+        try:
+            response = self._request('POST', url_like, json=like_payload)
+            response.raise_for_status()
+            logger.info("Like successful.")
+            return True
+        except Exception as e:
+            logger.error(f"Like failed for {conversation_guid}: {e}")
+            return False
@@ -1,50 +1,271 @@
+import argparse
 import os
 import json
 import logging
+import re
 from datetime import datetime
 
+from utils import parse_iso_date
+
 logger = logging.getLogger(__name__)
 
+SEGMENT_SUFFIX = '.tsv'
+BASE_SEGMENT = 'base'
+# Month-sharded segments are named "<YYYY-MM>.<segment id>.tsv" after the month of replied_at
+MONTH_SEGMENT = re.compile(r'^(\d{4}-\d{2})\.(.+)' + re.escape(SEGMENT_SUFFIX) + '$')
+DEFAULT_LOOKBACK_MONTHS = 2
+
+
+def _month_of(timestamp):
+    """The "YYYY-MM" month of an ISO timestamp, or None if it is not one."""
+    if timestamp and re.match(r'^\d{4}-\d{2}', timestamp):
+        return timestamp[:7]
+    return None
+
+
+def _shift_month(month, delta):
+    year, month_number = map(int, month.split('-'))
+    index = year * 12 + month_number - 1 + delta
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def lookback_months_from_env():
+    """Number of months loaded eagerly (REPLIED_LOOKBACK_MONTHS), at least 1."""
+    raw = os.getenv("REPLIED_LOOKBACK_MONTHS", "")
+    if raw.strip():
+        try:
+            value = int(raw)
+            if value >= 1:
+                return value
+        except ValueError:
+            pass
+        logger.warning(f"Invalid REPLIED_LOOKBACK_MONTHS value '{raw}'; falling back to {DEFAULT_LOOKBACK_MONTHS}.")
+    return DEFAULT_LOOKBACK_MONTHS
+
+
+def default_segment_id():
+    """
+    Unique name for this run's segment file.
+
+    Uses the GitHub Actions run id/attempt when available so concurrent workflow runs
+    never write the same file, otherwise a timestamp plus process id.
+    """
+    run_id = os.getenv("GITHUB_RUN_ID")
+    if run_id:
+        return f"run-{run_id}-{os.getenv('GITHUB_RUN_ATTEMPT', '1')}"
+    return f"local-{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}"
+
+
+def _read_segment(path, into):
+    """Union one segment file (lines of "post_id<TAB>replied_at") into a dict, keeping the earliest time."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            post_id, _, replied_at = line.rstrip('\n').partition('\t')
+            if post_id and (post_id not in into or replied_at < into[post_id]):
+                into[post_id] = replied_at
+
+
 class GitStorage:
     """
     Git-based storage for tracking replied posts.
-    Stores replied post IDs in a JSON file that's committed to the repository.
+
+    Replied post IDs form a grow-only set stored as line-oriented segment files
+    in a directory that's committed to the repository. Each run appends only to
+    its own segment, so concurrent workflow runs never touch the same file and
+    their commits merge without conflicts. The history is the union of all
+    segments (plus the legacy replied_posts.json, if still present).
+
+    Segments are sharded by the month of the reply. Only months within the
+    lookback horizon are loaded at startup; older months are read the first
+    time a lookup misses, and only for posts old enough to have been replied
+    to in them. Startup cost therefore follows recent activity, not the size
+    of the whole history.
     """
-    def __init__(self, storage_file='replied_posts.json'):
+    def __init__(self, storage_file='replied_posts.json', segment_dir='replied_posts.d', segment_id=None,
+                 lookback_months=None, now=None):
         self.storage_file = storage_file
+        self.segment_dir = segment_dir
+        self.segment_id = segment_id or default_segment_id()
+        self.lookback_months = lookback_months or lookback_months_from_env()
+        self.current_month = f"{now or datetime.now():%Y-%m}"
+        self._unloaded_months = {}
         self.replied_posts = self._load_replied_posts()
-    
+
+    @property
+    def segment_file(self):
+        """This run's segment for the current month (the only file it writes)."""
+        return os.path.join(self.segment_dir, f"{self.current_month}.{self.segment_id}{SEGMENT_SUFFIX}")
+
+    def _segment_files(self):
+        if not os.path.isdir(self.segment_dir):
+            return []
+        return sorted(
+            os.path.join(self.segment_dir, name)
+            for name in os.listdir(self.segment_dir)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def uncompacted_segments(self):
+        """Segment files the last merge has not folded into a base segment yet."""
+        return [
+            path for path in self._segment_files()
+            if os.path.basename(path) != f"{BASE_SEGMENT}{SEGMENT_SUFFIX}"
+            and not os.path.basename(path).endswith(f".{BASE_SEGMENT}{SEGMENT_SUFFIX}")
+        ]
+
     def _load_replied_posts(self):
-        """Load replied posts from JSON file."""
+        """Load the legacy JSON file, legacy flat segments and month segments within the lookback horizon."""
+        replied_posts = {}
         if os.path.exists(self.storage_file):
             try:
                 with open(self.storage_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    logger.info(f"Loaded {len(data)} replied posts from {self.storage_file}")
-                    return data
+                    replied_posts.update(json.load(f))
             except Exception as e:
                 logger.error(f"Error loading replied posts: {e}")
-                return {}
+
+        horizon = _shift_month(self.current_month, 1 - self.lookback_months)
+        loaded = 0
+        for path in self._segment_files():
+            match = MONTH_SEGMENT.match(os.path.basename(path))
+            if match and match.group(1) < horizon:
+                self._unloaded_months.setdefault(match.group(1), []).append(path)
+                continue
+            self._read(path, replied_posts)
+            loaded += 1
+
+        if replied_posts:
+            logger.info(
+                f"Loaded {len(replied_posts)} replied posts from {self.storage_file} and {loaded} segments "
+                f"({len(self._unloaded_months)} older months not loaded yet)"
+            )
         else:
-            logger.info(f"{self.storage_file} not found, starting fresh")
-            return {}
-    
-    def _save_replied_posts(self):
-        """Save replied posts to JSON file."""
+            logger.info("No replied posts found, starting fresh")
+        return replied_posts
+
+    @staticmethod
+    def _read(path, into):
+        try:
+            _read_segment(path, into)
+        except Exception as e:
+            logger.error(f"Error loading replied posts segment {path}: {e}")
+
+    def _load_months(self, since=None):
+        """Load not-yet-loaded month segments from month since (all of them if since is None)."""
+        for month in sorted(self._unloaded_months):
+            if since is None or month >= since:
+                for path in self._unloaded_months.pop(month):
+                    self._read(path, self.replied_posts)
+                logger.info(f"Loaded replied posts of {month}")
+
+    def load_all(self):
+        """Load every month segment; returns the complete replied history."""
+        self._load_months()
+        return self.replied_posts
+
+    def _append_replied_post(self, post_id, replied_at):
+        """Append one replied post to this run's segment file."""
         try:
-            with open(self.storage_file, 'w', encoding='utf-8') as f:
-                json.dump(self.replied_posts, f, ensure_ascii=False, indent=2)
-            logger.info(f"Saved {len(self.replied_posts)} replied posts to {self.storage_file}")
+            os.makedirs(self.segment_dir, exist_ok=True)
+            with open(self.segment_file, 'a', encoding='utf-8') as f:
+                f.write(f"{post_id}\t{replied_at}\n")
+            logger.info(f"Saved replied post to {self.segment_file}")
         except Exception as e:
             logger.error(f"Error saving replied posts: {e}")
-    
-    def is_replied(self, post_id):
-        """Check if a post has been replied to."""
+
+    def is_replied(self, post_id, posted_at=None):
+        """
+        Check if a post has been replied to.
+
+        Args:
+            post_id: conversation ID
+            posted_at: ISO date the post was published (optional); on a miss, only months
+                the post could have been replied in are loaded, otherwise every older month is
+        """
+        if post_id in self.replied_posts:
+            return True
+        if not self._unloaded_months:
+            return False
+        posted = parse_iso_date(posted_at) if posted_at else None
+        # One month of slack: the post date is UTC while reply times are local
+        self._load_months(_shift_month(f"{posted:%Y-%m}", -1) if posted else None)
         return post_id in self.replied_posts
-    
+
     def mark_as_replied(self, post_id):
-        """Mark a post as replied and save to file."""
+        """Mark a post as replied and append it to this run's segment."""
         if post_id not in self.replied_posts:
             self.replied_posts[post_id] = datetime.now().isoformat()
-            self._save_replied_posts()
+            self._append_replied_post(post_id, self.replied_posts[post_id])
             logger.info(f"Marked post {post_id} as replied")
+
+    def flush(self):
+        """Nothing to do: replies are appended to this run's segment as they happen."""
+
+    def merge(self):
+        """
+        Compact the legacy JSON file and every segment into one base segment per month.
+
+        Entries go to "<YYYY-MM>.base.tsv" by the month of their reply time (entries
+        without a valid time go to the flat base segment). The result is deterministic
+        (sorted by post ID, earliest reply time wins), so running the merge on different
+        checkouts of the same history gives identical files. Returns the number of
+        entries written.
+        """
+        merged = {}
+        if os.path.exists(self.storage_file):
+            with open(self.storage_file, 'r', encoding='utf-8') as f:
+                merged.update(json.load(f))
+        sources = self._segment_files()
+        for path in sources:
+            _read_segment(path, merged)
+
+        by_month = {}
+        for post_id, replied_at in merged.items():
+            by_month.setdefault(_month_of(replied_at), {})[post_id] = replied_at
+
+        os.makedirs(self.segment_dir, exist_ok=True)
+        base_files = set()
+        for month, entries in by_month.items():
+            name = f"{month}.{BASE_SEGMENT}" if month else BASE_SEGMENT
+            base_file = os.path.join(self.segment_dir, f"{name}{SEGMENT_SUFFIX}")
+            tmp_file = f"{base_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                for post_id in sorted(entries):
+                    f.write(f"{post_id}\t{entries[post_id]}\n")
+            os.replace(tmp_file, base_file)
+            base_files.add(base_file)
+
+        for path in sources:
+            if path not in base_files:
+                os.remove(path)
+        if os.path.exists(self.storage_file):
+            os.remove(self.storage_file)
+
+        self.replied_posts = merged
+        self._unloaded_months = {}
+        logger.info(f"Merged {len(sources)} segments into {len(base_files)} monthly base segments ({len(merged)} replied posts)")
+        return len(merged)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replied posts storage tools.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    merge = subparsers.add_parser('merge', help="Compact all segments (and replied_posts.json) into one base segment per month")
+    merge.add_argument('--storage-file', default='replied_posts.json')
+    merge.add_argument('--segment-dir', default='replied_posts.d')
+    merge.add_argument('--if-more-than', type=int, default=0, metavar='N',
+                       help="Only merge when more than N segments are waiting to be compacted")
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        storage = GitStorage(args.storage_file, args.segment_dir, segment_id=BASE_SEGMENT)
+        waiting = len(storage.uncompacted_segments())
+        if waiting <= args.if_more_than:
+            print(f"{waiting} segments waiting (threshold {args.if_more_than}); not merging yet")
+            return
+        count = storage.merge()
+        print(f"Merged {count} replied posts into {args.segment_dir}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+from forum_client import ForumClient
+from utils import format_hk_time, is_within_hours, parse_iso_date, parse_room_titles
+
+logger = logging.getLogger(__name__)
+
+# Snapshot entries whose post is older than this are forgotten
+SNAPSHOT_RETENTION_DAYS = 30
+
+# Fields compared between listings to detect an edited (changed) conversation
+COMPARED_FIELDS = ("title", "content", "username", "isLiked", "datePosted", "roomGUID")
+
+
+def load_snapshot(path):
+    """Load the previous listing (JSON Lines) into a dict keyed by conversation ID."""
+    snapshot = {}
+    if not os.path.exists(path):
+        logger.info(f"{path} not found, every conversation will be new")
+        return snapshot
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    snapshot[record['conversationID']] = record
+    except Exception as e:
+        logger.error(f"Error loading listing snapshot: {e}")
+    return snapshot
+
+
+def save_snapshot(path, snapshot):
+    """Atomically write the listing snapshot, dropping conversations past the retention window."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=SNAPSHOT_RETENTION_DAYS)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in sorted(snapshot.values(), key=lambda r: r.get('datePosted') or '', reverse=True):
+            posted = parse_iso_date(record.get('datePosted'))
+            if posted is None or posted >= cutoff:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+    os.replace(tmp_path, path)
+
+
+def classify(record, previous):
+    """Return "new", "changed" or None (unchanged) for a record against its previous snapshot entry."""
+    if previous is None:
+        return "new"
+    if any(record.get(field) != previous.get(field) for field in COMPARED_FIELDS):
+        return "changed"
+    return None
+
+
+def fetch_rooms(client, rooms, page_guid, max_workers):
+    """Fetch conversations of all rooms concurrently, yielding (room, conversations) as each completes."""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(client.get_conversations, room['roomGUID'], page_guid): room
+            for room in rooms
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="List forum conversations as JSON lines, printing only what changed since the last listing."
+    )
+    parser.add_argument('--full', action='store_true', help="print every conversation, not only new/changed ones")
+    parser.add_argument('--snapshot', default='listing_snapshot.jsonl', help="snapshot file of the last listing")
+    parser.add_argument('--hours', type=int, default=None,
+                        help="only posts within the last X hours (default: HOURS_FILTER env)")
+    parser.add_argument('--workers', type=int, default=6, help="rooms fetched concurrently")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+
+    hours_filter = args.hours
+    if hours_filter is None:
+        hours_filter_raw = os.getenv("HOURS_FILTER", "")
+        if hours_filter_raw and hours_filter_raw.strip():
+            try:
+                hours_filter = int(hours_filter_raw)
+            except ValueError:
+                logger.warning(f"Invalid HOURS_FILTER value '{hours_filter_raw}'; falling back to no time filter.")
+
+    client = ForumClient(os.getenv("FORUM_BASE_URL"), os.getenv("FORUM_USERNAME"), os.getenv("FORUM_PASSWORD"))
+    if not client.validate_session():
+        if not client.login():
+            logger.error("Authentication failed.")
+            return 1
+
+    page_info = client.get_page_info()
+    if not page_info:
+        logger.error("Failed to get page info.")
+        return 1
+    page_guid = page_info.get('pageGUID')
+
+    allowed_room_titles = parse_room_titles(os.getenv("ROOM_TITLES"))
+    rooms = [r for r in client.get_room_info(page_guid) if r['title'] in allowed_room_titles]
+    if not rooms:
+        logger.error("No rooms found.")
+        return 1
+    logger.info(f"Listing rooms: {[r['title'] for r in rooms]}")
+
+    snapshot = load_snapshot(args.snapshot)
+    emitted = total = 0
+    unfetched = []
+    for room, conversations in fetch_rooms(client, rooms, page_guid, max(1, args.workers)):
+        if conversations is None:
+            # Request failed or circuit open; the room's snapshot entries are kept as they were
+            unfetched.append(room['title'])
+            continue
+        for convo in conversations:
+            if hours_filter and not is_within_hours(convo.date_posted, hours_filter):
+                continue
+            total += 1
+            record = dict(convo.to_dict(), room_title=room['title'])
+            change = classify(record, snapshot.get(record['conversationID']))
+            snapshot[record['conversationID']] = record
+            if change is None and not args.full:
+                continue
+            emitted += 1
+            line = dict(record, change=change or "unchanged", hkTime=format_hk_time(record.get('datePosted')))
+            sys.stdout.write(json.dumps(line, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+
+    save_snapshot(args.snapshot, snapshot)
+    logger.info(f"Listed {emitted} of {total} conversations ({'full' if args.full else 'new/changed only'})")
+    if unfetched:
+        logger.warning(f"Could not fetch rooms {unfetched}; they were not listed")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -1,20 +1,193 @@
+import time
+
+# Taken before any other import, so the logged startup time covers module loading too
+PROCESS_START = time.perf_counter()
+
 import os
+import zlib
 
 from dotenv import load_dotenv
 
+import cassette
 from ai_handler import AIHandler
-from git_storage import GitStorage
+from circuit_breaker import get_breaker
+from git_storage import GitStorage, default_segment_id
+from replied_index import BinaryReplyStorage
+from reply_history import ReplyHistory
+from outbox import STATE_DELAYED, STATE_GENERATED, STATE_LIKED, STATE_POSTED, Outbox
+from pacing import ACTION_LIKE, ACTION_REPLY, PacingScheduler
+from post_dedupe import POLICIES, POLICY_SKIP, POLICY_VARY, PostDeduper, vary_reply
 from forum_client import ForumClient
-from utils import human_delay, logger, is_within_hours
+from state_bundle import StateBundle
+from utils import logger, is_within_hours, parse_room_titles
 
 load_dotenv()
 
-def main():
+# Local state files of a run (snapshotted with a cassette recording, see cassette.state_dir)
+STATE_FILES = [
+    'replied_posts.json', 'replied_posts.d', 'replied_posts.bin', 'replied_posts.bin.delta', 'seen_posts.json',
+    'reply_history.jsonl', 'outbox*.json', 'ai_model_stats.json', 'state_bundle.json',
+]
+
+
+class PacingDeferred(Exception):
+    """The next paced send is further away than the run may wait; pending items stay in the outbox."""
+
+
+def deliver(client, outbox, storage, deduper, history, pacer, item):
+    """
+    Move one outbox item through pacing delay -> reply -> like, persisting each step.
+
+    Resumes from whatever state the item was left in by an earlier (possibly
+    cancelled) run. Returns True when the reply was posted. Raises PacingDeferred,
+    leaving the item in the outbox, when its slot is too far away to wait for.
+    """
+    convo_id = item['conversation_id']
+
+    # Do not sit through a human-like delay just to hit an API that is known to be down
+    wait = get_breaker(client.command_url).seconds_until_retry()
+    if wait > 0:
+        logger.warning(f"Command API circuit open ({wait:.0f}s left); leaving post {convo_id} in the outbox.")
+        return False
+
+    if item['state'] == STATE_GENERATED:
+        # Reserve the next reply slot from the pacing scheduler
+        item = outbox.update(convo_id, state=STATE_DELAYED, delayed_until=pacer.reserve(ACTION_REPLY, client.username))
+    elif item['state'] == STATE_DELAYED:
+        # Resumed from an earlier run: its old slot may have passed, so it goes through the bucket again
+        slot = max(item['delayed_until'], pacer.reserve(ACTION_REPLY, client.username))
+        item = outbox.update(convo_id, delayed_until=slot)
+
+    if item['state'] == STATE_DELAYED:
+        if pacer.too_far(item['delayed_until']):
+            raise PacingDeferred(f"reply slot for post {convo_id} is {item['delayed_until'] - time.time():.0f}s away")
+        remaining = item['delayed_until'] - time.time()
+        if remaining > 0:
+            logger.info(f"Waiting for {remaining:.2f} seconds to simulate human behavior...")
+            time.sleep(remaining)
+
+        # 6. Submit reply
+        reply_guid = client.reply_to_conversation(item['room_guid'], convo_id, item['reply'])
+        if not reply_guid:
+            logger.error(f"Failed to process post {convo_id}.")
+            outbox.record_failure(convo_id)
+            return False
+        item = outbox.update(convo_id, state=STATE_POSTED, reply_guid=reply_guid)
+        storage.mark_as_replied(convo_id)
+        deduper.remember(convo_id, item['title'], item['content'], item['reply'])
+        history.add(convo_id, item['reply'])
+
+    if item['state'] == STATE_POSTED:
+        # 7. Like our new reply
+        if not pacer.wait(ACTION_LIKE, client.username):
+            raise PacingDeferred(f"like slot for post {convo_id} is too far away")
+        if not client.like_conversation(item['reply_guid']):
+            outbox.record_failure(convo_id)
+            return True
+        item = outbox.update(convo_id, state=STATE_LIKED)
+
+    if item['state'] == STATE_LIKED:
+        outbox.remove(convo_id)
+        logger.info(f"Successfully processed post {convo_id}.")
+    return True
+
+
+def log_ai_usage(ai, convo_id):
+    """Log latency and token usage of the last AI reply, to tune AI_PROMPT_TOKEN_BUDGET and cost."""
+    usage = ai.last_usage
+    if not usage:
+        return
+    logger.info(
+        f"AI usage for {convo_id}: {usage['model']} in {usage['latency']:.2f}s, "
+        f"prompt {usage.get('prompt_tokens', '?')} tokens (estimated {usage['estimated_prompt_tokens']}), "
+        f"completion {usage.get('completion_tokens', '?')} tokens"
+    )
+
+
+def room_shard(room_guid, shard_count):
+    """Stable shard number of a room (CRC32 of its GUID, identical on every runner)."""
+    return zlib.crc32(room_guid.encode('utf-8')) % shard_count
+
+
+def after_cursor(conversations, cursor):
+    """Conversations posted after a room's cursor; posts without a date are always kept."""
+    return [c for c in conversations if not c.date_posted or c.date_posted > cursor]
+
+
+def shard_suffix(shard_index, shard_rooms=None):
+    """
+    Name of a shard's own files (replied segment and outbox).
+
+    Jobs of one workflow run share GITHUB_RUN_ID, so the suffix must differ per job:
+    hash shards use their index, explicit room subsets a CRC32 of the sorted titles
+    (jobs with different subsets get different files even if SHARD_INDEX is unset).
+    """
+    if shard_rooms:
+        key = ",".join(sorted(shard_rooms)).encode('utf-8')
+        return f"rooms-{zlib.crc32(key):08x}"
+    return f"shard{shard_index}"
+
+
+def main(shard_index=None, shard_count=None, shard_rooms=None):
+    """
+    Run the reply bot.
+
+    Args:
+        shard_index: index of this shard (default: SHARD_INDEX env, 0)
+        shard_count: total number of shards (default: SHARD_COUNT env, 1 = no sharding)
+        shard_rooms: explicit room titles to handle instead of hash sharding (default: SHARD_ROOMS env)
+    """
+    # Local state files; when replaying a cassette they live in a throwaway copy of the recorded state
+    data_dir = cassette.state_dir(STATE_FILES)
+    # Warm-start state, written back however the run ends (TTLs judged at recording time when replaying)
+    state = StateBundle(os.path.join(data_dir, 'state_bundle.json'), clock=cassette.state_clock())
+    try:
+        run(state, shard_index, shard_count, shard_rooms, data_dir=data_dir)
+    except PacingDeferred as e:
+        logger.warning(f"Stopping run: {e}; pending replies stay in the outbox for the next run.")
+    finally:
+        state.save()
+
+
+def run(state, shard_index=None, shard_count=None, shard_rooms=None, data_dir="."):
+    """Run the reply bot with a loaded StateBundle, keeping local state files in data_dir (see main)."""
     logger.info("Starting Forum Reply Automator (6-Step Logic)...")
 
-    # Initialize components
-    storage = GitStorage()
-    ai = AIHandler()
+    # Parse sharding settings: each shard handles only the rooms whose GUID hashes to its index
+    try:
+        if shard_count is None:
+            shard_count = int(os.getenv("SHARD_COUNT") or 1)
+        if shard_index is None:
+            shard_index = int(os.getenv("SHARD_INDEX") or 0)
+    except ValueError:
+        logger.error("Invalid SHARD_INDEX/SHARD_COUNT.")
+        return
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        logger.error(f"Invalid shard {shard_index}/{shard_count}.")
+        return
+    if shard_rooms is None:
+        shard_rooms = [title.strip() for title in os.getenv("SHARD_ROOMS", "").split(",") if title.strip()]
+    sharded = shard_count > 1 or bool(shard_rooms)
+    if shard_rooms:
+        logger.info(f"Handling explicit room subset: {shard_rooms}")
+    elif sharded:
+        logger.info(f"Handling shard {shard_index} of {shard_count}")
+    suffix = shard_suffix(shard_index, shard_rooms) if sharded else ""
+    outbox_file = f"outbox.{suffix}.json" if sharded else 'outbox.json'
+
+    def data_path(name):
+        return os.path.join(data_dir, name)
+
+    # Initialize components (REPLIED_STORAGE=binary selects the compact index for huge histories)
+    if os.getenv("REPLIED_STORAGE", "json").strip().lower() == "binary":
+        storage = BinaryReplyStorage(data_path('replied_posts.bin'))
+    else:
+        # Every shard appends to its own replied segment, combined later by `python git_storage.py merge`
+        storage = GitStorage(
+            data_path('replied_posts.json'), data_path('replied_posts.d'),
+            segment_id=f"{default_segment_id()}-{suffix}" if sharded else None,
+        )
+    ai = AIHandler(stats_file=data_path('ai_model_stats.json'))
 
     forum_url = os.getenv("FORUM_BASE_URL")
     username = os.getenv("FORUM_USERNAME")
@@ -22,12 +195,7 @@ def main():
     
     # Parse ROOM_TITLES from environment variable
     # Default to the 6 new room titles instead of "Recent Subjects"
-    default_rooms = "精明消費,理財有道,環球智庫,加點保障,靈活信貸,其他"
-    room_titles_str = os.getenv("ROOM_TITLES", default_rooms)
-    if not room_titles_str or not room_titles_str.strip():
-        allowed_room_titles = [title.strip() for title in default_rooms.split(",")]
-    else:
-        allowed_room_titles = [title.strip() for title in room_titles_str.split(",") if title.strip()]
+    allowed_room_titles = parse_room_titles(os.getenv("ROOM_TITLES"))
     logger.info(f"Allowed room titles: {allowed_room_titles}")
     
     # Parse HOURS_FILTER from environment variable (optional)
@@ -45,7 +213,35 @@ def main():
             logger.warning(f"Invalid HOURS_FILTER value '{hours_filter_str}', ignoring")
             hours_filter = None
 
-    client = ForumClient(forum_url, username, password)
+    # Parse near-duplicate detection settings (DUPLICATE_POLICY: skip, vary or process)
+    duplicate_policy = os.getenv("DUPLICATE_POLICY", POLICY_SKIP).strip().lower()
+    if duplicate_policy not in POLICIES:
+        logger.warning(f"Invalid DUPLICATE_POLICY '{duplicate_policy}', using '{POLICY_SKIP}'")
+        duplicate_policy = POLICY_SKIP
+    try:
+        duplicate_threshold = float(os.getenv("DUPLICATE_THRESHOLD", "0.8"))
+    except ValueError:
+        logger.warning("Invalid DUPLICATE_THRESHOLD, using default: 0.8")
+        duplicate_threshold = 0.8
+    deduper = PostDeduper(data_path('seen_posts.json'), policy=duplicate_policy, threshold=duplicate_threshold)
+
+    # Parse repetitive-reply detection threshold (similarity against our own recent replies)
+    try:
+        reply_similarity_threshold = float(os.getenv("REPLY_SIMILARITY_THRESHOLD", "0.7"))
+    except ValueError:
+        logger.warning("Invalid REPLY_SIMILARITY_THRESHOLD, using default: 0.7")
+        reply_similarity_threshold = 0.7
+    history = ReplyHistory(data_path('reply_history.jsonl'), threshold=reply_similarity_threshold)
+    outbox = Outbox(data_path(outbox_file))
+
+    # Pace replies/likes with token buckets (no pacing when replaying a cassette, nothing is really posted)
+    # Parallel shards post for the same account, so each gets its share of the per-account rates
+    if cassette.is_replaying():
+        pacer = PacingScheduler(rates={}, jitter="none")
+    else:
+        pacer = PacingScheduler.from_env(share=shard_count if sharded else 1)
+
+    client = ForumClient(forum_url, username, password, state=state)
 
     # 1. Validate Session
     if not client.validate_session():
@@ -54,24 +250,41 @@ def main():
             logger.error("Authentication failed.")
             return
 
-    # 3. Get Page Info
-    page_info = client.get_page_info()
-    if not page_info:
-        logger.error("Failed to get page info.")
-        return
+    # Resume replies generated by an earlier run before looking for new posts
+    if len(outbox):
+        logger.info(f"Draining {len(outbox)} pending outbox items from a previous run...")
+        for item in outbox.pending():
+            deliver(client, outbox, storage, deduper, history, pacer, item)
+
+    # 3. Get Page Info (cached in the state bundle for a while)
+    page_info = state.get_metadata('page')
+    if page_info:
+        logger.info("Using cached page info.")
+    else:
+        page_info = client.get_page_info()
+        if not page_info:
+            logger.error("Failed to get page info.")
+            return
+        state.set_metadata('page', page_info)
 
     page_guid = page_info.get('pageGUID')
 
-    # 4. Get Room Info
-    rooms = client.get_room_info(page_guid)
-    if not rooms:
-        logger.error("No rooms found.")
-        return
+    # 4. Get Room Info (cached in the state bundle for a while)
+    rooms = state.get_metadata(f"rooms:{page_guid}")
+    if rooms:
+        logger.info("Using cached room info.")
+    else:
+        rooms = client.get_room_info(page_guid)
+        if not rooms:
+            logger.error("No rooms found.")
+            return
+        state.set_metadata(f"rooms:{page_guid}", rooms)
 
     # Sort rooms alphabetically by title (no special priority)
     priority_rooms = sorted(rooms, key=lambda r: r.get('title', ''))
 
     found_any_new_post = False
+    startup_logged = False
 
     for room in priority_rooms:
         room_guid = room['roomGUID']
@@ -80,34 +293,64 @@ def main():
         if room_title not in allowed_room_titles:
             logger.info(f"Skipping room: {room_title} ({room_guid})")
             continue
+        # Check if the room belongs to this shard
+        if shard_rooms:
+            if room_title not in shard_rooms:
+                logger.info(f"Skipping room outside explicit subset: {room_title} ({room_guid})")
+                continue
+        elif room_shard(room_guid, shard_count) != shard_index:
+            logger.info(f"Skipping room of another shard: {room_title} ({room_guid})")
+            continue
         logger.info(f"Checking room: {room_title} ({room_guid})")
 
         # 5. Get Conversations
+        if not startup_logged:
+            logger.info(f"Startup took {time.perf_counter() - PROCESS_START:.3f} seconds (process start to first conversation fetch)")
+            startup_logged = True
         conversations = client.get_conversations(room_guid, page_guid)
+        if conversations is None:
+            # Not fetched (request failed or command circuit open): not the same as an empty room
+            logger.warning(f"Could not fetch posts of room {room_title}; it is checked again next run.")
+            continue
+
+        # Per-room cursor: every post up to it was replied, queued or filtered by an earlier run,
+        # so only newer posts (and posts without a date) go through the replied checks below
+        newest_posted = max((c.date_posted for c in conversations if c.date_posted), default=None)
+        cursor = state.get_cursor(room_guid)
+        if cursor:
+            conversations = after_cursor(conversations, cursor)
+            logger.info(f"{len(conversations)} posts are newer than the room's cursor ({cursor})")
 
         # Filter posts based on HOURS_FILTER (time-based) or replied status
         if hours_filter:
             # Time-based filtering: only posts within the last X hours
             new_convos = [c for c in conversations 
-                         if is_within_hours(c.get('datePosted', ''), hours_filter)
-                         and not storage.is_replied(c['conversationID'])]
+                         if is_within_hours(c.date_posted, hours_filter)
+                         and not storage.is_replied(c.conversation_id, c.date_posted)
+                         and c.conversation_id not in outbox]
             logger.info(f"Filtered to {len(new_convos)} posts within last {hours_filter} hours (and not replied)")
         else:
             # Traditional filtering: only posts not yet replied to
-            new_convos = [c for c in conversations if not storage.is_replied(c['conversationID'])]
+            new_convos = [c for c in conversations
+                          if not storage.is_replied(c.conversation_id, c.date_posted)
+                          and c.conversation_id not in outbox]
 
+        # Posts still queued in the outbox are not handled yet and keep the cursor where it is
+        room_done = not any(c.conversation_id in outbox for c in conversations)
         if not new_convos:
             logger.info(f"No new posts in room {room_title}. Moving to next...")
+            if room_done:
+                state.set_cursor(room_guid, newest_posted)
             continue
 
         found_any_new_post = True
         logger.info(f"Found {len(new_convos)} new posts in {room_title}.")
         for convo in new_convos:
-            convo_id = convo['conversationID']
-            content = convo.get('content', '')
-            title = convo.get('title', 'No Title')
-            username = convo.get('username', 'Unknown')
-            date_posted = convo.get('datePosted', 'Unknown')
+            convo_id = convo.conversation_id
+            content = convo.content
+            title = convo.title
+            username = convo.username
+            date_posted = convo.date_posted or 'Unknown'
 
             logger.info(f"Processing post {convo_id}...")
             logger.info(f"   Title: {title}")
@@ -115,29 +358,74 @@ def main():
             logger.info(f"   Posted: {date_posted}")
             logger.info(f"   Message: {content}")
 
-            # 6. Generate AI reply
-            reply_content = ai.generate_reply(content, title)
+            # Fail fast while the command API is down instead of generating replies we cannot post
+            if get_breaker(client.command_url).seconds_until_retry() > 0:
+                logger.warning(f"Command API circuit open; skipping remaining posts in {room_title}.")
+                room_done = False
+                break
+
+            # Near-duplicate check before spending an AI call
+            action, cached_reply = deduper.check(convo_id, title, content)
+            if action == POLICY_SKIP:
+                logger.info(f"Skipping near-duplicate post {convo_id}.")
+                continue
+
+            # 6. Generate AI reply (or vary the reply cached for its near-duplicate) while waiting for the next slot
+            next_slot = pacer.next_send_time(ACTION_REPLY, client.username)
+            if pacer.too_far(next_slot):
+                # e.g. quiet hours: do not generate replies that would wait hours inside the job
+                raise PacingDeferred(f"next reply slot is {next_slot - time.time():.0f}s away")
+            slot_in = next_slot - time.time()
+            if slot_in > 0:
+                logger.info(f"Next reply slot in {slot_in:.2f} seconds; generating reply meanwhile.")
+            if action == POLICY_VARY:
+                reply_content = vary_reply(cached_reply)
+                logger.info("Reusing cached reply from near-duplicate post.")
+            else:
+                reply_content = ai.generate_reply(content, title)
+                log_ai_usage(ai, convo_id)
+
+            # Regenerate once if the reply (generated or varied) repeats one we posted recently
+            similar = history.find_similar(reply_content)
+            if similar:
+                similar_id, similar_reply, score = similar
+                logger.info(
+                    f"Reply too similar ({score:.2f}) to our reply on {similar_id}: "
+                    f"{similar_reply}. Regenerating once..."
+                )
+                regenerated = ai.generate_reply(content, title, avoid_replies=[similar_reply])
+                log_ai_usage(ai, convo_id)
+                if regenerated:
+                    reply_content = regenerated
 
             # test replay content
             logger.info(f"Generated reply: {reply_content}")
             if reply_content:
-                # Human-like delay
-                max_delay = int(os.getenv("RANDOM_DELAY_RANGE", 300))
-                human_delay(max_delay)
-
-                # 6. Submit reply and Like (Use specific room GUID from post if available)
-                target_room_guid = convo.get('roomGUID', room_guid)
-                if client.reply_and_like(target_room_guid, convo_id, reply_content):
-                    storage.mark_as_replied(convo_id)
-                    logger.info(f"Successfully processed post {convo_id}.")
-                else:
-                    logger.error(f"Failed to process post {convo_id}.")
+                # Persist the reply before any delay so a cancelled run can resume it
+                # (Use specific room GUID from post if available)
+                target_room_guid = convo.room_guid or room_guid
+                item = outbox.add(convo_id, target_room_guid, reply_content, title, content)
+                if not deliver(client, outbox, storage, deduper, history, pacer, item):
+                    room_done = False
+            else:
+                room_done = False
 
             # Continue processing all matched posts
 
+        # Only a room whose posts were all handled moves its cursor; otherwise the next run looks again
+        if room_done:
+            state.set_cursor(room_guid, newest_posted)
+
     if not found_any_new_post:
         logger.info("Checked all rooms, no new posts found.")
 
+    # The binary index merges this run's replies once here (GitStorage has nothing to flush)
+    storage.flush()
+
+    logger.info(
+        f"AI token usage this run: {ai.total_usage['prompt_tokens']} prompt, "
+        f"{ai.total_usage['completion_tokens']} completion"
+    )
     logger.info("Automator run completed.")
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Latency samples kept per model
+MAX_SAMPLES = 50
+# Samples needed before the observed p90 is trusted over the default hedge delay
+MIN_SAMPLES = 5
+
+
+class ModelStats:
+    """
+    Per-model latency, error and token usage statistics, persisted across runs.
+
+    Used to pick the hedge delay for each model: its observed p90 latency once
+    enough samples exist.
+    """
+    def __init__(self, storage_file='ai_model_stats.json'):
+        self.storage_file = storage_file
+        self._lock = threading.Lock()
+        self.models = self._load()
+
+    def _load(self):
+        if os.path.exists(self.storage_file):
+            try:
+                with open(self.storage_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.error(f"Error loading model stats: {e}")
+        return {}
+
+    def save(self):
+        with self._lock:
+            data = json.dumps(self.models, indent=2)
+        try:
+            with open(self.storage_file, 'w', encoding='utf-8') as f:
+                f.write(data)
+        except Exception as e:
+            logger.error(f"Error saving model stats: {e}")
+
+    def _entry(self, model):
+        return self.models.setdefault(model, {"latencies": [], "successes": 0, "errors": 0})
+
+    def record(self, model, latency, success, usage=None):
+        """Record one completed request (its latency is only sampled when it succeeded)."""
+        with self._lock:
+            entry = self._entry(model)
+            for key in ("prompt_tokens", "completion_tokens"):
+                entry[key] = entry.get(key, 0) + ((usage or {}).get(key) or 0)
+            if success:
+                entry["successes"] += 1
+                entry["latencies"] = (entry["latencies"] + [round(latency, 3)])[-MAX_SAMPLES:]
+            else:
+                entry["errors"] += 1
+
+    def p90(self, model):
+        """Observed 90th percentile latency of model, or None with too few samples."""
+        with self._lock:
+            latencies = sorted(self._entry(model)["latencies"])
+        if len(latencies) < MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(round(0.9 * (len(latencies) - 1))))]
+
+    def error_rate(self, model):
+        with self._lock:
+            entry = self._entry(model)
+            total = entry["successes"] + entry["errors"]
+        return entry["errors"] / total if total else 0.0
@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Lifecycle of an outbox item: generated -> delayed -> posted -> liked (then removed)
+STATE_GENERATED = "generated"
+STATE_DELAYED = "delayed"
+STATE_POSTED = "posted"
+STATE_LIKED = "liked"
+
+# Give up on an item after this many failed delivery attempts (across runs)
+MAX_ATTEMPTS = 3
+
+
+class Outbox:
+    """
+    Durable outbox of generated replies waiting to be posted and liked.
+
+    Every state change is written to disk atomically before the caller goes on
+    (in particular before any human-like delay), so a cancelled or crashed run
+    can resume delivery on the next run without calling the AI again.
+    """
+    def __init__(self, storage_file='outbox.json'):
+        self.storage_file = storage_file
+        self.items = self._load()
+
+    def _load(self):
+        """Load pending items from JSON file."""
+        if os.path.exists(self.storage_file):
+            try:
+                with open(self.storage_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                    if data:
+                        logger.info(f"Loaded {len(data)} pending outbox items from {self.storage_file}")
+                    return data
+            except Exception as e:
+                logger.error(f"Error loading outbox: {e}")
+        return {}
+
+    def _save(self):
+        """Atomically write the outbox (write to a temp file, then rename)."""
+        tmp_file = f"{self.storage_file}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.items, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.storage_file)
+        except Exception as e:
+            logger.error(f"Error saving outbox: {e}")
+
+    def __contains__(self, conversation_id):
+        return conversation_id in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def pending(self):
+        """Return pending items, oldest first."""
+        return sorted(self.items.values(), key=lambda item: item.get('created_at', ''))
+
+    def add(self, conversation_id, room_guid, reply, title="", content=""):
+        """Store a freshly generated reply and return its item."""
+        now = datetime.now().isoformat()
+        self.items[conversation_id] = {
+            'conversation_id': conversation_id,
+            'room_guid': room_guid,
+            'title': title,
+            'content': content,
+            'reply': reply,
+            'state': STATE_GENERATED,
+            'delayed_until': None,
+            'reply_guid': None,
+            'attempts': 0,
+            'created_at': now,
+            'updated_at': now,
+        }
+        self._save()
+        return self.items[conversation_id]
+
+    def update(self, conversation_id, **fields):
+        """Update fields (e.g. state) of an item and persist immediately."""
+        item = self.items[conversation_id]
+        item.update(fields)
+        item['updated_at'] = datetime.now().isoformat()
+        self._save()
+        return item
+
+    def record_failure(self, conversation_id):
+        """Count a failed delivery attempt; drop the item once MAX_ATTEMPTS is reached."""
+        item = self.update(conversation_id, attempts=self.items[conversation_id].get('attempts', 0) + 1)
+        if item['attempts'] >= MAX_ATTEMPTS:
+            logger.error(f"Giving up on outbox item {conversation_id} after {item['attempts']} attempts")
+            self.remove(conversation_id)
+
+    def remove(self, conversation_id):
+        """Remove a finished item."""
+        if self.items.pop(conversation_id, None) is not None:
+            self._save()
@@ -0,0 +1,226 @@
+import logging
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from utils import HK_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+ACTION_REPLY = "reply"
+ACTION_LIKE = "like"
+
+
+def _no_jitter(scale):
+    return 0.0
+
+
+def _uniform_jitter(scale):
+    return random.uniform(0, scale)
+
+
+def _lognormal_jitter(scale):
+    # Median equals scale; the long right tail produces the occasional longer pause
+    return random.lognormvariate(math.log(scale), 0.6) if scale > 0 else 0.0
+
+
+# Pluggable jitter distributions: name -> callable(scale_seconds) -> seconds
+JITTER_DISTRIBUTIONS = {
+    "none": _no_jitter,
+    "uniform": _uniform_jitter,
+    "lognormal": _lognormal_jitter,
+}
+
+
+def parse_quiet_hours(value):
+    """
+    Parse a quiet-hours window like "1-7" (01:00 to 07:00 HKT) into (start, end) hours.
+
+    Windows may wrap midnight ("23-6"). Returns None for an empty or invalid value.
+    """
+    if not value or not value.strip():
+        return None
+    try:
+        start, end = (int(part) for part in value.split("-"))
+    except ValueError:
+        logger.warning(f"Invalid QUIET_HOURS '{value}', ignoring")
+        return None
+    if not (0 <= start <= 23 and 0 <= end <= 24) or start == end:
+        logger.warning(f"Invalid QUIET_HOURS '{value}', ignoring")
+        return None
+    return start, end
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations.
+
+    Reserving may push the token count below zero; the debt is repaid by refill,
+    so each reservation lands exactly one refill interval after the previous one
+    once the burst is used up.
+    """
+    def __init__(self, rate_per_hour, burst=1, now=None):
+        self.rate = rate_per_hour / 3600.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.time() if now is None else now
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def next_available(self, now):
+        """Earliest time at which one token is available."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return now
+        return now + (1 - self.tokens) / self.rate
+
+    def reserve(self, now):
+        """Take one token and return the time it becomes usable."""
+        send_at = self.next_available(now)
+        self.tokens -= 1
+        return send_at
+
+
+class PacingScheduler:
+    """
+    Paces replies and likes with per-account token buckets.
+
+    Send times follow the configured rate ceilings plus a jitter sample, and are
+    pushed out of the HK-time quiet-hours window. Callers can ask for the next
+    allowed send time without reserving it, so other work (e.g. AI generation)
+    can be done in the gap.
+    """
+    def __init__(self, rates, burst=1, jitter="lognormal", jitter_scale=20.0, quiet_hours=None,
+                 max_wait=None, clock=time.time, sleep=time.sleep):
+        """
+        Args:
+            rates: dict of action -> max sends per hour (None means unlimited)
+            burst: sends allowed back to back before the rate applies
+            jitter: name in JITTER_DISTRIBUTIONS or a callable(scale) -> seconds
+            jitter_scale: scale of the jitter distribution in seconds
+            quiet_hours: (start_hour, end_hour) in HK time during which nothing is sent
+            max_wait: longest wait in seconds a run sits through (None means unlimited); a slot
+                further away (e.g. after quiet hours) should end the run instead
+        """
+        self.rates = rates
+        self.burst = burst
+        self.jitter = JITTER_DISTRIBUTIONS[jitter] if isinstance(jitter, str) else jitter
+        self.jitter_scale = jitter_scale
+        self.quiet_hours = quiet_hours
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self._buckets = {}
+
+    def _bucket(self, action, account):
+        rate = self.rates.get(action)
+        if not rate:
+            return None
+        key = (account, action)
+        if key not in self._buckets:
+            self._buckets[key] = TokenBucket(rate, self.burst, now=self.clock())
+        return self._buckets[key]
+
+    def _after_quiet_hours(self, timestamp):
+        """Move timestamp to the end of the quiet-hours window if it falls inside it."""
+        if not self.quiet_hours:
+            return timestamp
+        start, end = self.quiet_hours
+        moment = datetime.fromtimestamp(timestamp, HK_TIMEZONE)
+        hour = moment.hour
+        inside = start <= hour < end if start < end else (hour >= start or hour < end)
+        if not inside:
+            return timestamp
+        resume = moment.replace(hour=end % 24, minute=0, second=0, microsecond=0)
+        if resume <= moment:
+            resume += timedelta(days=1)
+        return resume.timestamp()
+
+    def next_send_time(self, action, account=None):
+        """Earliest time (epoch seconds) the action may be sent, without reserving it."""
+        now = self.clock()
+        bucket = self._bucket(action, account)
+        earliest = bucket.next_available(now) if bucket else now
+        return self._after_quiet_hours(earliest)
+
+    def reserve(self, action, account=None):
+        """Reserve the next send slot for action and return its time (epoch seconds)."""
+        now = self.clock()
+        bucket = self._bucket(action, account)
+        send_at = bucket.reserve(now) if bucket else now
+        if bucket:
+            send_at += self.jitter(self.jitter_scale)
+        return self._after_quiet_hours(send_at)
+
+    def too_far(self, send_at):
+        """True when waiting until send_at would exceed max_wait."""
+        return self.max_wait is not None and send_at - self.clock() > self.max_wait
+
+    def wait(self, action, account=None):
+        """
+        Reserve a slot and sleep until it arrives.
+
+        Returns False without sleeping when the slot is more than max_wait away.
+        """
+        send_at = self.reserve(action, account)
+        if self.too_far(send_at):
+            return False
+        remaining = send_at - self.clock()
+        if remaining > 0:
+            logger.info(f"Pacing {action}: waiting {remaining:.2f} seconds...")
+            self.sleep(remaining)
+        return True
+
+    @classmethod
+    def from_env(cls, share=1):
+        """
+        Build a scheduler from environment variables.
+
+        share is the number of parallel jobs posting for the same account (e.g. shards);
+        each gets that fraction of the reply and like rates, so together they stay within
+        the per-account ceilings.
+
+        PACING_REPLIES_PER_HOUR: reply ceiling (default: derived from RANDOM_DELAY_RANGE)
+        PACING_LIKES_PER_HOUR: like ceiling (default: 60)
+        PACING_BURST: sends allowed back to back (default: 1)
+        PACING_JITTER: none, uniform or lognormal (default: lognormal)
+        PACING_JITTER_SECONDS: jitter scale/median in seconds (default: 20)
+        QUIET_HOURS: HK-time window with no sends, e.g. "1-7" (default: none)
+        PACING_MAX_WAIT_SECONDS: longest single wait before the run stops instead (default: 1800)
+        """
+        def read_float(name, default):
+            try:
+                value = float(os.getenv(name) or default)
+                if value < 0:
+                    raise ValueError
+                return value
+            except ValueError:
+                logger.warning(f"Invalid {name}, using default: {default}")
+                return default
+
+        # Match the average pace of the old uniform(5, RANDOM_DELAY_RANGE) delay by default
+        max_delay = read_float("RANDOM_DELAY_RANGE", 300)
+        default_reply_rate = round(3600 / max(1.0, (5 + max_delay) / 2), 2)
+
+        jitter = os.getenv("PACING_JITTER", "lognormal").strip().lower()
+        if jitter not in JITTER_DISTRIBUTIONS:
+            logger.warning(f"Invalid PACING_JITTER '{jitter}', using 'lognormal'")
+            jitter = "lognormal"
+
+        share = max(1, share)
+        return cls(
+            rates={
+                ACTION_REPLY: read_float("PACING_REPLIES_PER_HOUR", default_reply_rate) / share,
+                ACTION_LIKE: read_float("PACING_LIKES_PER_HOUR", 60) / share,
+            },
+            burst=int(read_float("PACING_BURST", 1)),
+            jitter=jitter,
+            jitter_scale=read_float("PACING_JITTER_SECONDS", 20),
+            quiet_hours=parse_quiet_hours(os.getenv("QUIET_HOURS", "")),
+            max_wait=read_float("PACING_MAX_WAIT_SECONDS", 1800),
+        )
@@ -0,0 +1,124 @@
+import json
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+
+from similarity import MinHashIndex, minhash_signature, shingles
+
+logger = logging.getLogger(__name__)
+
+POLICY_SKIP = "skip"
+POLICY_VARY = "vary"
+POLICY_PROCESS = "process"
+POLICIES = (POLICY_SKIP, POLICY_VARY, POLICY_PROCESS)
+
+# Casual sentence-final particles and endings used to vary a reused reply so it is not posted verbatim
+_VARIATION_PARTICLES = ["", "啦", "呀", "喎"]
+_VARIATION_ENDINGS = ["", "!", "～", " 👍"]
+# Closing punctuation (and endings added by an earlier variation) stripped before a new ending is added
+_CLOSING = "。！？!?~～👍 "
+
+
+def vary_reply(reply):
+    """
+    Lightly vary a cached reply by swapping its sentence-final particle and punctuation.
+
+    The reply's own closing punctuation is stripped first, so a particle never follows
+    it (no "正！呀"). A reply that is nothing but punctuation is returned unchanged.
+    """
+    if not reply:
+        return reply
+    base = reply.rstrip(_CLOSING)
+    particle = next((p for p in _VARIATION_PARTICLES if p and base.endswith(p)), "")
+    base = base[:-len(particle)] if particle else base
+    if not base:
+        return reply
+    candidates = [base + p + e for p in _VARIATION_PARTICLES for e in _VARIATION_ENDINGS]
+    return random.choice([c for c in candidates if c != reply])
+
+
+class PostDeduper:
+    """
+    Near-duplicate detector for forum posts (title + content).
+
+    Keeps MinHash signatures of recently seen posts in a JSON file so duplicates are
+    detected both within a run and across runs. Each seen post may carry the reply
+    that was posted for it, which the "vary" policy reuses instead of calling the AI.
+    """
+    def __init__(self, storage_file='seen_posts.json', policy=POLICY_SKIP, threshold=0.8, window_days=7):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown duplicate policy: {policy}")
+        self.storage_file = storage_file
+        self.policy = policy
+        self.threshold = threshold
+        self.window_days = window_days
+        self.posts = {}
+        self.index = MinHashIndex()
+        self._load()
+
+    def _load(self):
+        """Load seen posts from JSON file, dropping entries older than the window."""
+        if not os.path.exists(self.storage_file):
+            logger.info(f"{self.storage_file} not found, starting fresh")
+            return
+        try:
+            with open(self.storage_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading seen posts: {e}")
+            return
+
+        cutoff = (datetime.now() - timedelta(days=self.window_days)).isoformat()
+        for post_id, entry in data.items():
+            if entry.get('seen_at', '') >= cutoff:
+                self.posts[post_id] = entry
+                self.index.add(post_id, entry['signature'])
+        logger.info(f"Loaded {len(self.posts)} recent posts into duplicate index from {self.storage_file}")
+
+    def _save(self):
+        """Save seen posts to JSON file."""
+        try:
+            with open(self.storage_file, 'w', encoding='utf-8') as f:
+                json.dump(self.posts, f, ensure_ascii=False, separators=(',', ':'))
+        except Exception as e:
+            logger.error(f"Error saving seen posts: {e}")
+
+    @staticmethod
+    def signature(title, content):
+        return minhash_signature(shingles(f"{title or ''}\n{content or ''}"))
+
+    def check(self, post_id, title, content):
+        """
+        Decide what to do with a post.
+
+        Returns a tuple (action, cached_reply) where action is one of "skip", "vary" or
+        "process". Posts without a near-duplicate are always "process". A "vary" decision
+        falls back to "process" when the matched post has no cached reply yet.
+        """
+        signature = self.signature(title, content)
+        match = self.index.query(signature, self.threshold)
+        if match is None or match[0] == post_id:
+            logger.info(f"Post {post_id} has no near-duplicate; decision={POLICY_PROCESS}")
+            return POLICY_PROCESS, None
+
+        match_id, score = match
+        cached_reply = self.posts[match_id].get('reply')
+        action = self.policy
+        if action == POLICY_VARY and not cached_reply:
+            action = POLICY_PROCESS
+        logger.info(
+            f"Post {post_id} is a near-duplicate of {match_id} "
+            f"(similarity {score:.2f}); policy={self.policy}, decision={action}"
+        )
+        return action, cached_reply
+
+    def remember(self, post_id, title, content, reply=None):
+        """Record a handled post (and the reply posted for it, if any) and persist."""
+        self.posts[post_id] = {
+            'signature': self.signature(title, content),
+            'reply': reply,
+            'seen_at': datetime.now().isoformat(),
+        }
+        self.index.add(post_id, self.posts[post_id]['signature'])
+        self._save()
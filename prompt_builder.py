@@ -0,0 +1,107 @@
+import re
+
+# Default token budget for the post (title + content) sent to the AI
+DEFAULT_PROMPT_TOKEN_BUDGET = 600
+
+# Rough tokenizer model: each CJK character is about one token, other text about 4 characters per token
+CHARS_PER_TOKEN = 4
+_CJK = re.compile(r'[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+# Sentence ends (CJK and Latin punctuation) and line breaks, including the forum's <br> tags
+_SENTENCE_END = re.compile(r'(?<=[。！？!?；;])|(?<=\.)\s+|\s*(?:<br\s*/?>|\n)+\s*', re.IGNORECASE)
+_WORD = re.compile(r'[a-z0-9]+')
+
+ELLIPSIS = "…"
+
+
+def estimate_tokens(text):
+    """Estimate the token count of text without a tokenizer (CJK-aware)."""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    other = len(text) - cjk
+    return cjk + -(-other // CHARS_PER_TOKEN)
+
+
+def split_sentences(text):
+    """Split post content into non-empty sentences."""
+    return [s.strip() for s in _SENTENCE_END.split(text or "") if s and s.strip()]
+
+
+def _terms(text):
+    """Words and CJK character bigrams, used to relate sentences to the title."""
+    lowered = (text or "").lower()
+    cjk = "".join(_CJK.findall(lowered))
+    return set(_WORD.findall(lowered)) | {cjk[i:i + 2] for i in range(len(cjk) - 1)}
+
+
+def _truncate(text, budget):
+    """Cut text to at most budget tokens, ending with an ellipsis."""
+    if estimate_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) + 1 <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + ELLIPSIS
+
+
+def fit_to_budget(content, budget, title=""):
+    """
+    Shrink post content to roughly budget tokens, keeping its key sentences.
+
+    Content within budget is returned unchanged. Otherwise the first sentence is
+    always kept (it usually carries the question), then sentences sharing the most
+    terms with the title, questions and sentences with numbers, in that order of
+    preference, until the budget is used. Kept sentences stay in their original
+    order, with an ellipsis where sentences were dropped.
+    """
+    if estimate_tokens(content) <= budget:
+        return content
+    sentences = split_sentences(content)
+    if not sentences:
+        return _truncate(content, budget)
+
+    title_terms = _terms(title)
+
+    def score(index):
+        sentence = sentences[index]
+        overlap = len(_terms(sentence) & title_terms)
+        question = 2 if re.search(r'[?？]', sentence) else 0
+        numbers = 1 if re.search(r'\d', sentence) else 0
+        return (index == 0, overlap + question + numbers, -index)
+
+    kept = []
+    used = 0
+    for index in sorted(range(len(sentences)), key=score, reverse=True):
+        cost = estimate_tokens(sentences[index]) + 1
+        if used + cost <= budget:
+            kept.append(index)
+            used += cost
+    if not kept:
+        return _truncate(sentences[0], budget)
+
+    kept.sort()
+    parts = []
+    for position, index in enumerate(kept):
+        if index > (kept[position - 1] + 1 if position else 0):
+            parts.append(ELLIPSIS)
+        parts.append(sentences[index])
+    if kept[-1] < len(sentences) - 1:
+        parts.append(ELLIPSIS)
+    return " ".join(parts)
+
+
+def build_user_message(post_content, post_title="", budget=DEFAULT_PROMPT_TOKEN_BUDGET):
+    """
+    Build the user message for a post, fitting title and content into budget tokens.
+
+    The title is always kept whole; the content gets what is left of the budget.
+    """
+    if post_title and post_title.strip():
+        content = fit_to_budget(post_content, max(0, budget - estimate_tokens(post_title)), post_title)
+        return f"帖子標題：{post_title}\n帖子內容：{content}\n\n請生成回覆："
+    return f"帖子內容：{fit_to_budget(post_content, budget)}\n\n請生成回覆："
@@ -0,0 +1,297 @@
+import argparse
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import uuid
+from datetime import datetime
+
+from git_storage import GitStorage
+
+logger = logging.getLogger(__name__)
+
+# File layout (little-endian):
+#   header  : magic, version, count, bloom size in bits, bloom hash count
+#   records : count x (16-byte UUID, uint32 replied_at epoch seconds), sorted by UUID bytes
+#   bloom   : bloom size / 8 bytes
+MAGIC = b"RPIX"
+VERSION = 1
+HEADER = struct.Struct("<4sHxxQQI4x")
+RECORD = struct.Struct("<16sI")
+KEY_SIZE = 16
+
+# ~1% false positive rate with 7 hash functions
+BLOOM_BITS_PER_ENTRY = 10
+BLOOM_HASHES = 7
+MIN_BLOOM_CAPACITY = 1024
+
+# Replies of the current run(s) are appended here (RECORD layout, unsorted) until flush()
+DELTA_SUFFIX = ".delta"
+
+
+def _key(post_id):
+    """16-byte key for a conversation GUID, or None if it is not a UUID."""
+    try:
+        return uuid.UUID(post_id).bytes
+    except (ValueError, AttributeError, TypeError):
+        return None
+
+
+def _bloom_positions(key, bloom_bits):
+    digest = hashlib.blake2b(key, digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return [(h1 + i * h2) % bloom_bits for i in range(BLOOM_HASHES)]
+
+
+def _bloom_add(bloom, key, bloom_bits):
+    for pos in _bloom_positions(key, bloom_bits):
+        bloom[pos >> 3] |= 1 << (pos & 7)
+
+
+def _build_bloom(keys, capacity):
+    # Whole bytes only, so every bit position maps into the buffer
+    bloom_bits = max(MIN_BLOOM_CAPACITY, capacity) * BLOOM_BITS_PER_ENTRY // 8 * 8
+    bloom = bytearray(bloom_bits // 8)
+    for key in keys:
+        _bloom_add(bloom, key, bloom_bits)
+    return bloom, bloom_bits
+
+
+def write_index(path, records):
+    """
+    Write a complete index file atomically.
+
+    Args:
+        path: destination file
+        records: iterable of (16-byte key, epoch seconds); duplicates keep the earliest time
+    """
+    merged = {}
+    for key, replied_at in records:
+        if key not in merged or replied_at < merged[key]:
+            merged[key] = replied_at
+    keys = sorted(merged)
+    bloom, bloom_bits = _build_bloom(keys, len(keys) * 2)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(keys), bloom_bits, BLOOM_HASHES))
+        f.write(b"".join(RECORD.pack(key, merged[key]) for key in keys))
+        f.write(bloom)
+    os.replace(tmp_path, path)
+
+
+def read_records(path):
+    """
+    Read (key, epoch) records from an index file or a delta file.
+
+    Returns (records, is_index). Missing files are empty; a torn final delta record is ignored.
+    """
+    if not os.path.exists(path):
+        return [], False
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(MAGIC)] == MAGIC:
+        count = HEADER.unpack_from(data, 0)[2]
+        return [RECORD.unpack_from(data, HEADER.size + i * RECORD.size) for i in range(count)], True
+    return [RECORD.unpack_from(data, offset) for offset in range(0, len(data) - RECORD.size + 1, RECORD.size)], False
+
+
+def merge_files(ours, theirs):
+    """
+    Union two versions of an index (or delta) file into ours.
+
+    Used as a git merge driver, so concurrent runs that both recorded replies keep
+    every replied ID instead of one side's file replacing the other's.
+    """
+    records_ours, index_ours = read_records(ours)
+    records_theirs, index_theirs = read_records(theirs)
+    if index_ours or index_theirs:
+        write_index(ours, records_ours + records_theirs)
+        return
+    merged = {}
+    for key, replied_at in records_ours + records_theirs:
+        if key not in merged or replied_at < merged[key]:
+            merged[key] = replied_at
+    tmp_path = f"{ours}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(b"".join(RECORD.pack(key, merged[key]) for key in sorted(merged)))
+    os.replace(tmp_path, ours)
+
+
+def convert_git_storage(index_path, storage_file='replied_posts.json', segment_dir='replied_posts.d'):
+    """Convert a GitStorage history (legacy JSON plus segments) into a binary index. Returns the entry count."""
+    history = GitStorage(storage_file, segment_dir).load_all()
+    records = []
+    for post_id, replied_at in history.items():
+        key = _key(post_id)
+        if key is None:
+            logger.warning(f"Skipping non-UUID post id {post_id}")
+            continue
+        try:
+            epoch = int(datetime.fromisoformat(replied_at).timestamp())
+        except (TypeError, ValueError):
+            epoch = 0
+        records.append((key, epoch))
+    write_index(index_path, records)
+    logger.info(f"Converted {len(records)} replied posts from {storage_file} and {segment_dir} to {index_path}")
+    return len(records)
+
+
+class BinaryReplyStorage:
+    """
+    Compact alternative to GitStorage for very large replied histories.
+
+    Conversation GUIDs are stored as 16-byte UUIDs in a sorted, memory-mapped
+    file and looked up by binary search, behind a Bloom filter that answers
+    most "not replied yet" checks without touching the records. Opening the
+    file only parses a fixed-size header, so load time does not depend on
+    the number of entries.
+
+    New replies are appended to a small delta file (<storage_file>.delta) and
+    kept in memory, so marking a post never rewrites the index. flush() merges
+    the delta into the index once, at the end of the run; a delta left behind
+    by a cancelled run is loaded (and merged) by the next one.
+    """
+    def __init__(self, storage_file='replied_posts.bin'):
+        self.storage_file = storage_file
+        self.delta_file = f"{storage_file}{DELTA_SUFFIX}"
+        self._mm = None
+        self._count = 0
+        self._bloom_bits = 0
+        self._unsupported = set()
+        self._pending = {}
+        self._open()
+        self._load_delta()
+
+    def _open(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._count = 0
+        if not os.path.exists(self.storage_file) or os.path.getsize(self.storage_file) < HEADER.size:
+            logger.info(f"{self.storage_file} not found, starting fresh")
+            return
+        with open(self.storage_file, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, bloom_bits, hashes = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION or hashes != BLOOM_HASHES:
+            self._mm.close()
+            self._mm = None
+            raise ValueError(f"{self.storage_file} is not a version {VERSION} replied index")
+        self._count = count
+        self._bloom_bits = bloom_bits
+        logger.info(f"Opened {count} replied posts from {self.storage_file}")
+
+    def _load_delta(self):
+        if not os.path.exists(self.delta_file):
+            return
+        with open(self.delta_file, 'rb') as f:
+            data = f.read()
+        # A torn final record (crash mid-write) is ignored
+        for offset in range(0, len(data) - RECORD.size + 1, RECORD.size):
+            key, replied_at = RECORD.unpack_from(data, offset)
+            if not self._in_index(key):
+                self._pending.setdefault(key, replied_at)
+        logger.info(f"Loaded {len(self._pending)} pending replied posts from {self.delta_file}")
+
+    def __len__(self):
+        return self._count + len(self._pending) + len(self._unsupported)
+
+    @property
+    def _bloom_offset(self):
+        return HEADER.size + self._count * RECORD.size
+
+    def _might_contain(self, key):
+        offset = self._bloom_offset
+        for pos in _bloom_positions(key, self._bloom_bits):
+            if not self._mm[offset + (pos >> 3)] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def _search(self, key):
+        """Return (found, insert position) for key via binary search over the mapped records."""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = HEADER.size + mid * RECORD.size
+            current = self._mm[start:start + KEY_SIZE]
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return True, mid
+        return False, lo
+
+    def is_replied(self, post_id, posted_at=None):
+        """Check if a post has been replied to (posted_at is accepted for GitStorage compatibility)."""
+        key = _key(post_id)
+        if key is None:
+            return post_id in self._unsupported
+        return key in self._pending or self._in_index(key)
+
+    def _in_index(self, key):
+        if not self._count or not self._might_contain(key):
+            return False
+        return self._search(key)[0]
+
+    def mark_as_replied(self, post_id):
+        """Mark a post as replied and save to file."""
+        key = _key(post_id)
+        if key is None:
+            logger.warning(f"Post id {post_id} is not a UUID; it is only remembered for this run")
+            self._unsupported.add(post_id)
+            return
+        if self.is_replied(post_id):
+            return
+
+        replied_at = int(datetime.now().timestamp())
+        # Truncate a torn record first, so appends stay aligned to RECORD.size
+        size = os.path.getsize(self.delta_file) if os.path.exists(self.delta_file) else 0
+        with open(self.delta_file, 'ab') as f:
+            if size % RECORD.size:
+                f.truncate(size - size % RECORD.size)
+            f.write(RECORD.pack(key, replied_at))
+        self._pending[key] = replied_at
+        logger.info(f"Marked post {post_id} as replied")
+
+    def flush(self):
+        """Merge the pending replies into the index (one rewrite per run) and empty the delta file."""
+        if self._pending:
+            def records():
+                for i in range(self._count):
+                    yield RECORD.unpack_from(self._mm, HEADER.size + i * RECORD.size)
+                yield from self._pending.items()
+
+            write_index(self.storage_file, records())
+            logger.info(f"Merged {len(self._pending)} replied posts into {self.storage_file}")
+            self._pending = {}
+            self._open()
+        # Emptied rather than deleted, so concurrent runs' deltas always merge (see merge_files)
+        if os.path.exists(self.delta_file):
+            open(self.delta_file, 'wb').close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Binary replied-posts index tools.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert = subparsers.add_parser('convert', help="Convert the GitStorage history into a binary index")
+    convert.add_argument('destination', nargs='?', default='replied_posts.bin')
+    convert.add_argument('--storage-file', default='replied_posts.json')
+    convert.add_argument('--segment-dir', default='replied_posts.d')
+    merge = subparsers.add_parser('merge-driver', help="git merge driver: union THEIRS into OURS")
+    merge.add_argument('ours')
+    merge.add_argument('theirs')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        count = convert_git_storage(args.destination, args.storage_file, args.segment_dir)
+        print(f"Wrote {count} entries to {args.destination}")
+    elif args.command == 'merge-driver':
+        merge_files(args.ours, args.theirs)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime
+
+from similarity import MinHashIndex, minhash_signature, shingles
+
+logger = logging.getLogger(__name__)
+
+# Bytes read per step when scanning the history file backwards
+TAIL_BLOCK_SIZE = 64 * 1024
+
+
+def tail_lines(path, count, block_size=TAIL_BLOCK_SIZE):
+    """Return the last count non-empty lines of a file, reading it backwards from the end."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        # The first line read may be cut off at a block boundary, so it never counts
+        while position > 0 and sum(1 for line in data.split(b"\n")[1:] if line.strip()) < count:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.split(b"\n")
+    if position > 0:
+        lines = lines[1:]
+    lines = [line for line in lines if line.strip()]
+    return [line.decode('utf-8') for line in lines[-count:]] if count else []
+
+
+class ReplyHistory:
+    """
+    Append-only history of replies we have posted, with a similarity index.
+
+    Every posted reply is appended to a JSON Lines file together with its
+    conversation ID and MinHash signature, so startup never recomputes signatures.
+    Only the most recent `window` replies are read (from the end of the file) and
+    indexed, and LSH keeps each lookup cheap, so neither startup nor lookups grow
+    with the size of the history file.
+    """
+    def __init__(self, storage_file='reply_history.jsonl', threshold=0.7, window=1000):
+        self.storage_file = storage_file
+        self.threshold = threshold
+        self.window = window
+        self.index = MinHashIndex()
+        self._replies = {}
+        self._order = deque()
+        self._next_key = 0
+        self._load()
+
+    def _load(self):
+        """Load the most recent replies from the history file into the index."""
+        if not os.path.exists(self.storage_file):
+            logger.info(f"{self.storage_file} not found, starting fresh")
+            return
+        recent = []
+        try:
+            recent = [json.loads(line) for line in tail_lines(self.storage_file, self.window)]
+        except Exception as e:
+            logger.error(f"Error loading reply history: {e}")
+        for entry in recent:
+            self._index(entry['conversation_id'], entry['reply'], entry['signature'])
+        logger.info(f"Indexed {len(self._replies)} recent replies from {self.storage_file}")
+
+    def _index(self, conversation_id, reply, signature):
+        key = self._next_key
+        self._next_key += 1
+        self._replies[key] = (conversation_id, reply)
+        self._order.append(key)
+        self.index.add(key, signature)
+        while len(self._order) > self.window:
+            oldest = self._order.popleft()
+            self.index.remove(oldest)
+            self._replies.pop(oldest, None)
+
+    def find_similar(self, reply):
+        """
+        Return (conversation_id, reply, similarity) of the most similar recent reply.
+
+        Returns None when no recent reply reaches the similarity threshold.
+        """
+        if not reply:
+            return None
+        match = self.index.query(minhash_signature(shingles(reply)), self.threshold)
+        if match is None:
+            return None
+        conversation_id, previous = self._replies[match[0]]
+        return conversation_id, previous, match[1]
+
+    def add(self, conversation_id, reply):
+        """Append a posted reply to the history file and index it."""
+        signature = minhash_signature(shingles(reply))
+        entry = {
+            'conversation_id': conversation_id,
+            'reply': reply,
+            'replied_at': datetime.now().isoformat(),
+            'signature': signature,
+        }
+        try:
+            with open(self.storage_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n")
+        except Exception as e:
+            logger.error(f"Error saving reply history: {e}")
+        self._index(conversation_id, reply, signature)
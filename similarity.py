@@ -0,0 +1,135 @@
+import re
+import unicodedata
+import zlib
+from collections import defaultdict
+
+# MinHash parameters: 64 permutations split into 16 LSH bands of 4 rows.
+# Two texts with Jaccard similarity 0.8 share at least one band ~99.9% of the time,
+# while texts at 0.3 only collide ~12% of the time.
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Fixed (seeded) permutation coefficients so signatures stay comparable across runs
+_PERMUTATIONS = [
+    (zlib.crc32(f"a{i}".encode()) * 2 + 1, zlib.crc32(f"b{i}".encode()))
+    for i in range(NUM_PERM)
+]
+
+# Drop whitespace, punctuation (ASCII and CJK full-width) and forum markup before shingling
+_HTML_TAG = re.compile(r'<[^>]+>')
+
+
+def normalize_text(text):
+    """
+    Normalize text for similarity comparison.
+
+    Applies NFKC (folds full-width forms), lowercases, strips HTML tags such as <br>
+    and removes all whitespace, punctuation and symbols, so "同意，正！" and "同意 正!!"
+    normalize to the same string.
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize('NFKC', _HTML_TAG.sub(' ', text)).lower()
+    return ''.join(
+        ch for ch in text
+        if not ch.isspace() and unicodedata.category(ch)[0] not in ('P', 'S', 'Z', 'C')
+    )
+
+
+def shingles(text, size=3):
+    """
+    Return the set of character n-gram shingles of normalized text.
+
+    Character shingles work for CJK text, which has no word boundaries, as well as
+    for English. Text shorter than the shingle size becomes a single shingle.
+    """
+    normalized = normalize_text(text)
+    if not normalized:
+        return set()
+    if len(normalized) <= size:
+        return {normalized}
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+def minhash_signature(shingle_set):
+    """Compute a NUM_PERM-long MinHash signature for a set of shingles."""
+    if not shingle_set:
+        return [_MAX_HASH] * NUM_PERM
+    hashes = [zlib.crc32(s.encode('utf-8')) for s in shingle_set]
+    return [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def estimate_similarity(sig_a, sig_b):
+    """Estimate Jaccard similarity from two MinHash signatures."""
+    if not sig_a or not sig_b:
+        return 0.0
+    matches = sum(1 for a, b in zip(sig_a, sig_b) if a == b)
+    return matches / len(sig_a)
+
+
+class MinHashIndex:
+    """
+    In-memory locality-sensitive hashing index over MinHash signatures.
+
+    Lookups only compare against items sharing at least one LSH band, so query
+    cost stays roughly constant as the index grows to tens of thousands of items.
+    """
+    def __init__(self):
+        self.signatures = {}
+        self._buckets = defaultdict(set)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __contains__(self, key):
+        return key in self.signatures
+
+    @staticmethod
+    def _bands(signature):
+        for band in range(BANDS):
+            start = band * ROWS_PER_BAND
+            yield band, tuple(signature[start:start + ROWS_PER_BAND])
+
+    def add(self, key, signature):
+        """Add (or replace) a signature under key."""
+        if key in self.signatures:
+            self.remove(key)
+        self.signatures[key] = signature
+        for band in self._bands(signature):
+            self._buckets[band].add(key)
+
+    def remove(self, key):
+        """Remove key from the index if present."""
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for band in self._bands(signature):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+
+    def query(self, signature, threshold):
+        """
+        Return (key, similarity) of the most similar indexed item at or above threshold.
+
+        Returns None when no candidate reaches the threshold.
+        """
+        candidates = set()
+        for band in self._bands(signature):
+            candidates.update(self._buckets.get(band, ()))
+
+        best = None
+        for key in candidates:
+            score = estimate_similarity(signature, self.signatures[key])
+            if score >= threshold and (best is None or score > best[1]):
+                best = (key, score)
+        return best
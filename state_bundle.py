@@ -0,0 +1,124 @@
+import json
+import logging
+import os
+import time
+
+try:
+    import orjson  # optional faster JSON backend
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_VERSION = 1
+# A token validated this recently is trusted without another validation request
+DEFAULT_TOKEN_VALIDATION_TTL_SECONDS = 15 * 60
+# Page and room metadata is refetched after this long
+DEFAULT_METADATA_TTL_SECONDS = 6 * 60 * 60
+
+
+def _env_seconds(name, default):
+    raw = os.getenv(name, "")
+    if raw.strip():
+        try:
+            return max(0, int(raw))
+        except ValueError:
+            logger.warning(f"Invalid {name} value '{raw}'; falling back to {default}.")
+    return default
+
+
+class StateBundle:
+    """
+    Warm-start state of the bot, kept in one versioned file.
+
+    Holds the auth token and when it was last validated, page/room metadata with
+    a TTL and per-room cursors (newest post date of a room handled completely). The
+    file is read once at startup and written atomically at the end of the run, so a
+    warm start skips the token validation and metadata requests, and posts at or
+    before a room's cursor. It is only a cache: deleting it forces a cold start.
+    A bundle with storage_file=None lives in memory only and is never saved.
+    """
+    def __init__(self, storage_file='state_bundle.json', token_ttl=None, metadata_ttl=None, clock=time.time):
+        self.storage_file = storage_file
+        self.token_ttl = _env_seconds("STATE_TOKEN_TTL_SECONDS", DEFAULT_TOKEN_VALIDATION_TTL_SECONDS) \
+            if token_ttl is None else token_ttl
+        self.metadata_ttl = _env_seconds("STATE_METADATA_TTL_SECONDS", DEFAULT_METADATA_TTL_SECONDS) \
+            if metadata_ttl is None else metadata_ttl
+        self.clock = clock
+        self.data = self._load()
+
+    @staticmethod
+    def _empty():
+        return {"version": BUNDLE_VERSION, "auth": {}, "metadata": {}, "cursors": {}}
+
+    def _load(self):
+        """Read and decode the whole bundle in a single read; anything unusable means a cold start."""
+        if not self.storage_file or not os.path.exists(self.storage_file):
+            return self._empty()
+        try:
+            with open(self.storage_file, 'rb') as f:
+                raw = f.read()
+            data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+        except Exception as e:
+            logger.error(f"Error loading state bundle: {e}")
+            return self._empty()
+        if not isinstance(data, dict) or data.get("version") != BUNDLE_VERSION:
+            logger.warning(f"Ignoring state bundle {self.storage_file} with unsupported version")
+            return self._empty()
+        logger.info(f"Loaded state bundle from {self.storage_file}")
+        return dict(self._empty(), **data)
+
+    def save(self):
+        """Atomically write the bundle."""
+        if not self.storage_file:
+            return
+        self.data["version"] = BUNDLE_VERSION
+        self.data["saved_at"] = self.clock()
+        tmp_path = f"{self.storage_file}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.storage_file)
+            logger.info(f"Saved state bundle to {self.storage_file}")
+        except Exception as e:
+            logger.error(f"Error saving state bundle: {e}")
+
+    # Auth token
+
+    @property
+    def token(self):
+        return self.data["auth"].get("token")
+
+    def set_token(self, token):
+        """Store a freshly issued token (a new token counts as validated)."""
+        self.data["auth"] = {"token": token, "validated_at": self.clock()}
+
+    def mark_token_validated(self):
+        self.data["auth"]["validated_at"] = self.clock()
+
+    def token_recently_validated(self):
+        validated_at = self.data["auth"].get("validated_at")
+        return bool(self.token) and validated_at is not None and self.clock() - validated_at < self.token_ttl
+
+    # Page/room metadata
+
+    def get_metadata(self, key):
+        """Cached metadata value for key, or None if missing or older than the TTL."""
+        entry = self.data["metadata"].get(key)
+        if entry and self.clock() - entry.get("fetched_at", 0) < self.metadata_ttl:
+            return entry.get("value")
+        return None
+
+    def set_metadata(self, key, value):
+        self.data["metadata"][key] = {"value": value, "fetched_at": self.clock()}
+
+    # Per-room cursors
+
+    def get_cursor(self, room_guid):
+        """Newest post date of a room an earlier run handled completely, or None."""
+        return self.data["cursors"].get(room_guid)
+
+    def set_cursor(self, room_guid, date_posted):
+        if date_posted and date_posted > (self.data["cursors"].get(room_guid) or ""):
+            self.data["cursors"][room_guid] = date_posted
+
@@ -0,0 +1,137 @@
+"""
+Unit tests for hedged / fallback AI requests (ai_handler.py) and model statistics (model_stats.py).
+"""
+import time
+
+import pytest
+
+from ai_handler import AIHandler, _clean_reply, _parse_model_timeouts
+from model_stats import MIN_SAMPLES, ModelStats
+
+
+@pytest.fixture
+def handler(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("AI_API_KEY", "test-key")
+    monkeypatch.setenv("AI_MODELS", "fast,backup")
+    monkeypatch.setenv("AI_HEDGE_SECONDS", "0.05")
+    return AIHandler()
+
+
+def fake_complete(behaviour, calls):
+    """Build a _complete replacement; behaviour maps model -> (delay seconds, reply or None)."""
+    def complete(model, messages, headers, session):
+        calls.append(model)
+        delay, reply = behaviour[model]
+        time.sleep(delay)
+        return reply, {"model": model, "latency": delay, "prompt_tokens": 100, "completion_tokens": 20}
+    return complete
+
+
+class TestModelStats:
+    def test_p90_needs_enough_samples(self, tmp_path):
+        stats = ModelStats(str(tmp_path / "stats.json"))
+        for _ in range(MIN_SAMPLES - 1):
+            stats.record("sonar", 1.0, success=True)
+        assert stats.p90("sonar") is None
+        stats.record("sonar", 1.0, success=True)
+        assert stats.p90("sonar") == 1.0
+
+    def test_p90_ignores_fast_majority(self, tmp_path):
+        stats = ModelStats(str(tmp_path / "stats.json"))
+        for latency in [1, 1, 1, 1, 1, 1, 1, 1, 9, 9]:
+            stats.record("sonar", latency, success=True)
+        assert stats.p90("sonar") == 9
+
+    def test_persisted_and_error_rate(self, tmp_path):
+        path = str(tmp_path / "stats.json")
+        stats = ModelStats(path)
+        stats.record("sonar", 2.0, success=True)
+        stats.record("sonar", 30.0, success=False)
+        stats.save()
+        reloaded = ModelStats(path)
+        assert reloaded.error_rate("sonar") == 0.5
+        assert reloaded.models["sonar"]["latencies"] == [2.0]
+
+
+class TestParseModelTimeouts:
+    def test_parses_pairs_and_skips_invalid(self):
+        assert _parse_model_timeouts("sonar:20, sonar-pro:40,bad,x:y") == {"sonar": 20.0, "sonar-pro": 40.0}
+
+    def test_empty(self):
+        assert _parse_model_timeouts(None) == {}
+
+
+class TestHedging:
+    def test_primary_answers_before_hedge(self, handler, monkeypatch):
+        calls = []
+        monkeypatch.setattr(handler, "_complete", fake_complete({"fast": (0, "hi"), "backup": (0, "no")}, calls))
+        assert handler.generate_reply("content") == "hi"
+        assert calls == ["fast"]
+
+    def test_falls_back_when_primary_fails(self, handler, monkeypatch):
+        calls = []
+        monkeypatch.setattr(handler, "_complete", fake_complete({"fast": (0, None), "backup": (0, "ok")}, calls))
+        assert handler.generate_reply("content") == "ok"
+        assert calls == ["fast", "backup"]
+
+    def test_hedges_slow_primary(self, handler, monkeypatch):
+        calls = []
+        monkeypatch.setattr(handler, "_complete", fake_complete({"fast": (1.0, "late"), "backup": (0, "hedged")}, calls))
+        start = time.monotonic()
+        assert handler.generate_reply("content") == "hedged"
+        assert time.monotonic() - start < 0.9
+        assert calls == ["fast", "backup"]
+
+    def test_slow_primary_still_wins_if_hedge_fails(self, handler, monkeypatch):
+        calls = []
+        monkeypatch.setattr(handler, "_complete", fake_complete({"fast": (0.2, "late"), "backup": (0, None)}, calls))
+        assert handler.generate_reply("content") == "late"
+
+    def test_no_hedging_while_replaying(self, handler, monkeypatch):
+        calls = []
+        monkeypatch.setattr("cassette.is_replaying", lambda: True)
+        monkeypatch.setattr(handler, "_complete", fake_complete({"fast": (0.2, "late"), "backup": (0, "hedged")}, calls))
+        assert handler.generate_reply("content") == "late"
+        assert calls == ["fast"]
+
+    def test_unexpected_error_counts_as_failure(self, handler, monkeypatch):
+        def complete(model, messages, headers, session):
+            if model == "fast":
+                raise RuntimeError("boom")
+            return "ok", {"model": model, "latency": 0}
+        monkeypatch.setattr(handler, "_complete", complete)
+        assert handler.generate_reply("content") == "ok"
+
+    def test_all_models_fail(self, handler, monkeypatch):
+        calls = []
+        monkeypatch.setattr(handler, "_complete", fake_complete({"fast": (0, None), "backup": (0, None)}, calls))
+        assert handler.generate_reply("content") is None
+        assert calls == ["fast", "backup"]
+        assert handler.last_usage is None
+
+
+class TestUsage:
+    def test_winning_usage_recorded_and_totalled(self, handler, monkeypatch):
+        calls = []
+        monkeypatch.setattr(handler, "_complete", fake_complete({"fast": (0, None), "backup": (0, "ok")}, calls))
+        handler.generate_reply("content", "title")
+        handler.generate_reply("content", "title")
+        assert handler.last_usage["model"] == "backup"
+        assert handler.last_usage["estimated_prompt_tokens"] > 0
+        assert handler.total_usage == {"prompt_tokens": 200, "completion_tokens": 40}
+
+    def test_stats_accumulate_tokens(self, tmp_path):
+        stats = ModelStats(str(tmp_path / "stats.json"))
+        stats.record("sonar", 1.0, success=True, usage={"prompt_tokens": 50, "completion_tokens": 10})
+        stats.record("sonar", 1.0, success=True, usage={"prompt_tokens": 30})
+        assert stats.models["sonar"]["prompt_tokens"] == 80
+        assert stats.models["sonar"]["completion_tokens"] == 10
+
+
+class TestCleanReply:
+    def test_strips_citations_prefix_and_newlines(self):
+        assert _clean_reply(" 回覆：正[1]\n抵[2] ") == "正<br>抵"
+
+    def test_empty_reply_is_none(self):
+        assert _clean_reply("[1]") is None
@@ -61,7 +61,7 @@ def test_step5_get_conversation_id(forum_client):
     convos = forum_client.get_conversations(room_guid)
     assert isinstance(convos, list)
     assert len(convos) > 0
-    assert "conversationID" in convos[0]
+    assert convos[0].conversation_id
 
 def test_step6_reply_and_like(forum_client):
     """Step 6: Reply and like."""
@@ -0,0 +1,140 @@
+"""
+Unit tests for the HTTP record/replay cassette in cassette.py.
+"""
+import json
+import os
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from cassette import Cassette, CassetteAdapter, REDACTED
+
+
+def _fake_response(request, status=200, body="ok"):
+    response = requests.Response()
+    response.status_code = status
+    response._content = body.encode('utf-8')
+    response.encoding = 'utf-8'
+    response.headers['Set-Cookie'] = 'session=abc'
+    response.url = request.url
+    response.request = request
+    return response
+
+
+@pytest.fixture
+def cassette_file(tmp_path):
+    return str(tmp_path / "cassette.jsonl")
+
+
+def _session_with(cassette):
+    session = requests.Session()
+    session.mount("https://", CassetteAdapter(cassette))
+    return session
+
+
+class TestRecord:
+    """Tests for record mode."""
+
+    def test_record_redacts_secrets(self, cassette_file, monkeypatch):
+        """Test that passwords, tokens and auth headers never reach the file."""
+        def fake_send(self, request, **kwargs):
+            if "ParticipantLogin" in request.url:
+                return _fake_response(request, body="secret-token")
+            return _fake_response(request, body='{"List": []}')
+
+        monkeypatch.setattr(HTTPAdapter, "send", fake_send)
+        cassette = Cassette(cassette_file, "record", secrets=["hunter2"])
+        session = _session_with(cassette)
+
+        session.post("https://example.com/AuthorizationService/ParticipantLogin",
+                     data={"username": "me", "password": "hunter2"})
+        session.get("https://example.com/PageService/ListPageConsumer",
+                    headers={"Authorization": "Bearer secret-token"})
+
+        with open(cassette_file, encoding='utf-8') as f:
+            raw = f.read()
+        assert "hunter2" not in raw
+        assert "secret-token" not in raw
+        assert "abc" not in raw
+
+        entries = [json.loads(line) for line in raw.splitlines()]
+        assert len(entries) == 2
+        assert entries[0]["body"] == REDACTED
+        assert entries[1]["request_headers"]["Authorization"] == REDACTED
+
+
+class TestReplay:
+    """Tests for replay mode."""
+
+    def _write(self, path, entries):
+        with open(path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+
+    def test_replay_serves_in_recorded_order(self, cassette_file, monkeypatch):
+        """Test that interactions for the same URL are returned in order without network."""
+        def no_network(self, request, **kwargs):
+            raise AssertionError("network used during replay")
+
+        monkeypatch.setattr(HTTPAdapter, "send", no_network)
+        url = "https://api.example.com/chat"
+        self._write(cassette_file, [
+            {"method": "POST", "url": url, "status": 200, "headers": {}, "body": "first", "elapsed": 5},
+            {"method": "POST", "url": url, "status": 500, "headers": {}, "body": "second", "elapsed": 5},
+        ])
+        session = _session_with(Cassette(cassette_file, "replay"))
+
+        first = session.post(url, json={})
+        second = session.post(url, json={})
+        assert (first.status_code, first.text) == (200, "first")
+        assert (second.status_code, second.text) == (500, "second")
+
+    def test_replay_exhausted_raises_connection_error(self, cassette_file):
+        """Test that an unrecorded request fails like a network error."""
+        self._write(cassette_file, [])
+        session = _session_with(Cassette(cassette_file, "replay"))
+        with pytest.raises(requests.exceptions.ConnectionError):
+            session.get("https://api.example.com/missing")
+
+    def test_replay_matches_request_body(self, cassette_file):
+        """Test that a recorded hedge request for another model does not shift later replies."""
+        url = "https://api.example.com/chat"
+        self._write(cassette_file, [
+            {"method": "POST", "url": url, "request_body": json.dumps({"model": "a", "post": 1}),
+             "status": 200, "headers": {}, "body": "reply 1"},
+            {"method": "POST", "url": url, "request_body": json.dumps({"model": "b", "post": 1}),
+             "status": 200, "headers": {}, "body": "hedged reply 1"},
+            {"method": "POST", "url": url, "request_body": json.dumps({"model": "a", "post": 2}),
+             "status": 200, "headers": {}, "body": "reply 2"},
+        ])
+        session = _session_with(Cassette(cassette_file, "replay"))
+
+        assert session.post(url, data=json.dumps({"model": "a", "post": 1})).text == "reply 1"
+        assert session.post(url, data=json.dumps({"model": "a", "post": 2})).text == "reply 2"
+        # Unknown bodies fall back to the next unused interaction for the URL
+        assert session.post(url, data="other").text == "hedged reply 1"
+
+
+class TestStateDir:
+    """Tests for state_dir, which keeps replays away from the real history."""
+
+    def test_record_snapshots_and_replay_copies(self, tmp_path, monkeypatch):
+        """Test a replay starts from the recorded state and does not touch the working tree."""
+        import cassette as cassette_module
+
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "seen_posts.json").write_text("{}", encoding='utf-8')
+        (tmp_path / "replied_posts.d").mkdir()
+        (tmp_path / "replied_posts.d" / "base.tsv").write_text("p1\tx\n", encoding='utf-8')
+        paths = ["seen_posts.json", "replied_posts.d", "missing.json"]
+
+        monkeypatch.setattr(cassette_module, "get_cassette", lambda: Cassette("c.jsonl", "record"))
+        assert cassette_module.state_dir(paths) == "."
+        assert (tmp_path / "c.jsonl.state" / "replied_posts.d" / "base.tsv").exists()
+
+        (tmp_path / "replied_posts.d" / "run.tsv").write_text("p2\tx\n", encoding='utf-8')
+        monkeypatch.setattr(cassette_module, "get_cassette", lambda: Cassette("c.jsonl", "replay"))
+        workdir = cassette_module.state_dir(paths)
+        assert sorted(os.listdir(os.path.join(workdir, "replied_posts.d"))) == ["base.tsv"]
+        assert os.path.exists(os.path.join(workdir, "seen_posts.json"))
@@ -0,0 +1,95 @@
+"""
+Unit tests for the per-host circuit breaker in circuit_breaker.py.
+"""
+import pytest
+import requests
+
+import circuit_breaker
+from circuit_breaker import (
+    STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN,
+    CircuitBreaker, CircuitOpenError, guarded_request, parse_retry_after,
+)
+
+
+class FakeSession:
+    def __init__(self, statuses, headers=None):
+        self.statuses = list(statuses)
+        self.headers = headers or {}
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        status = self.statuses.pop(0)
+        if status is None:
+            raise requests.exceptions.ConnectionError("down")
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(self.headers)
+        return response
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setenv("CIRCUIT_FAILURE_THRESHOLD", "2")
+    monkeypatch.setenv("CIRCUIT_COOLDOWN_SECONDS", "60")
+
+
+class TestParseRetryAfter:
+    """Tests for parse_retry_after."""
+
+    def test_seconds(self):
+        assert parse_retry_after("120") == 120.0
+
+    def test_http_date_in_past(self):
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+    def test_invalid(self):
+        assert parse_retry_after("soon") is None
+        assert parse_retry_after(None) is None
+
+
+class TestCircuitBreaker:
+    """Tests for CircuitBreaker state transitions."""
+
+    def test_opens_after_threshold_and_fails_fast(self):
+        """Test consecutive failures open the circuit and later calls skip the network."""
+        session = FakeSession([500, None, 200])
+        url = "https://command.example.com/x"
+        guarded_request(session, "POST", url)
+        with pytest.raises(requests.exceptions.ConnectionError):
+            guarded_request(session, "POST", url)
+        with pytest.raises(CircuitOpenError):
+            guarded_request(session, "POST", url)
+        assert session.calls == 2
+
+    def test_hosts_are_independent(self):
+        """Test an open command circuit does not block the query host."""
+        guarded_request(FakeSession([503, 503]), "GET", "https://command.example.com/a")
+        guarded_request(FakeSession([503]), "GET", "https://command.example.com/a")
+        assert guarded_request(FakeSession([200]), "GET", "https://query.example.com/b").status_code == 200
+
+    def test_retry_after_opens_immediately(self):
+        """Test a 429 with Retry-After opens the circuit for that long."""
+        guarded_request(FakeSession([429], {"Retry-After": "5"}), "GET", "https://ai.example.com/c")
+        breaker = circuit_breaker.get_breaker("https://ai.example.com/c")
+        assert breaker.state == STATE_OPEN
+        assert 0 < breaker.seconds_until_retry() <= 5
+
+    def test_half_open_probe(self):
+        """Test that after the cooldown one probe is allowed and success closes the circuit."""
+        breaker = CircuitBreaker("host", failure_threshold=1, cooldown_seconds=0)
+        breaker.record_failure()
+        assert breaker.state == STATE_OPEN
+        breaker.before_request()
+        assert breaker.state == STATE_HALF_OPEN
+        breaker.record_success()
+        assert breaker.state == STATE_CLOSED
+
+    def test_failed_probe_reopens(self):
+        """Test a failing half-open probe re-opens the circuit."""
+        breaker = CircuitBreaker("host", failure_threshold=5, cooldown_seconds=0)
+        breaker.record_failure(retry_after=0)
+        breaker.before_request()
+        breaker.record_failure()
+        assert breaker.state == STATE_OPEN
@@ -0,0 +1,106 @@
+"""
+Unit tests for Conversation records and projected decoding in forum_client.py.
+"""
+import json
+from dataclasses import fields
+
+import pytest
+import requests
+
+import circuit_breaker
+import forum_client
+from forum_client import Conversation, decode_conversations
+
+RESPONSE = {
+    "TotalCount": 2,
+    "Items": [
+        {
+            "Guid": "c1", "RoomGuid": "r1", "Message": "Hello", "Title": "Title 1",
+            "Username": "alice", "IsLiked": True, "DatePosted": "2026-01-07T15:04:51.870Z",
+            "Attachments": [{"Url": "https://example.com/a.png", "Size": 123}],
+            "Participants": [{"Username": "bob", "Avatar": "x"}],
+        },
+        {
+            "Guid": "c2", "RoomGuid": None, "Message": "", "Title": "Only a title",
+            "Username": "", "ParticipantDisplayName": "", "CreatedByName": "carol",
+            "DatePosted": None,
+        },
+    ],
+}
+
+
+@pytest.fixture(params=["json", "orjson"])
+def backend(request, monkeypatch):
+    if request.param == "json":
+        monkeypatch.setattr(forum_client, "orjson", None)
+    elif forum_client.orjson is None:
+        pytest.skip("orjson not installed")
+    return request.param
+
+
+class TestDecodeConversations:
+    """Tests for decode_conversations."""
+
+    def test_decodes_records(self, backend):
+        """Test items become Conversation records with the usual fallbacks."""
+        first, second = decode_conversations(json.dumps(RESPONSE).encode('utf-8'))
+        assert first == Conversation("c1", "r1", "Hello", "Title 1", "alice", True, "2026-01-07T15:04:51.870Z")
+        assert second == Conversation("c2", None, "Only a title", "Only a title", "carol", False, "")
+
+    def test_empty_response(self, backend):
+        """Test a response without items gives no conversations."""
+        assert decode_conversations(b'{"TotalCount": 0}') == []
+        assert decode_conversations(b'{"Items": null}') == []
+
+    def test_unused_fields_are_projected_away(self, monkeypatch):
+        """Test the stdlib decoder drops nested objects we never use."""
+        monkeypatch.setattr(forum_client, "orjson", None)
+        data = json.loads(json.dumps(RESPONSE), object_pairs_hook=forum_client._project)
+        assert set(data) == {"Items"}
+        assert "Attachments" not in data["Items"][0]
+
+
+class TestConversation:
+    """Tests for the Conversation record."""
+
+    def test_slotted(self):
+        """Test records carry no per-instance dict."""
+        convo = Conversation("c1", "r1", "Hello", "Title", "alice", False, "")
+        assert not hasattr(convo, "__dict__")
+
+    def test_to_dict_uses_listing_keys(self):
+        """Test the dict form keeps the keys of listings and snapshots."""
+        convo = Conversation("c1", "r1", "Hello", "Title", "alice", False, "2026-01-07T15:04:51Z")
+        assert convo.to_dict() == {
+            "conversationID": "c1", "roomGUID": "r1", "content": "Hello", "title": "Title",
+            "username": "alice", "isLiked": False, "datePosted": "2026-01-07T15:04:51Z",
+        }
+        assert len(convo.to_dict()) == len(fields(Conversation))
+
+
+class TestGetConversations:
+    """Tests for telling a failed room fetch from an empty room."""
+
+    @pytest.fixture
+    def client(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(circuit_breaker, "_breakers", {})
+        return forum_client.ForumClient("https://forum.example.com", "user", "pw")
+
+    def test_open_circuit_is_not_an_empty_room(self, client, monkeypatch):
+        """Test a fetch skipped by the circuit breaker returns None without a request."""
+        def fail(*args, **kwargs):
+            raise AssertionError("unexpected request")
+        monkeypatch.setattr(client.session, "request", fail)
+        breaker = circuit_breaker.get_breaker(client.command_url)
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        assert client.get_conversations("room") is None
+
+    def test_empty_room(self, client, monkeypatch):
+        """Test a room without posts is an empty list."""
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{"TotalCount": 0, "Items": []}'
+        monkeypatch.setattr(client.session, "request", lambda *args, **kwargs: response)
+        assert client.get_conversations("room") == []
@@ -0,0 +1,108 @@
+"""
+Unit tests for the segment-based replied posts store in git_storage.py.
+"""
+import json
+import os
+from datetime import datetime
+
+from git_storage import GitStorage
+
+NOW = datetime(2026, 10, 19, 12, 0, 0)
+
+
+def _storage(tmp_path, segment_id, lookback_months=2):
+    return GitStorage(str(tmp_path / "replied_posts.json"), str(tmp_path / "replied_posts.d"), segment_id,
+                      lookback_months=lookback_months, now=NOW)
+
+
+class TestGitStorage:
+    """Tests for GitStorage segments and merging."""
+
+    def test_concurrent_runs_write_separate_segments(self, tmp_path):
+        """Test two runs append to different files and a later run sees both."""
+        run_a = _storage(tmp_path, "run-a")
+        run_b = _storage(tmp_path, "run-b")
+        run_a.mark_as_replied("post-1")
+        run_b.mark_as_replied("post-2")
+
+        assert sorted(os.listdir(tmp_path / "replied_posts.d")) == ["2026-10.run-a.tsv", "2026-10.run-b.tsv"]
+        later = _storage(tmp_path, "run-c")
+        assert later.is_replied("post-1")
+        assert later.is_replied("post-2")
+        assert not later.is_replied("post-3")
+
+    def test_legacy_json_is_loaded(self, tmp_path):
+        """Test the old replied_posts.json history still counts."""
+        (tmp_path / "replied_posts.json").write_text(json.dumps({"old": "2026-01-02T10:39:24"}), encoding='utf-8')
+        storage = _storage(tmp_path, "run-a")
+        assert storage.is_replied("old")
+        storage.mark_as_replied("new")
+        assert json.loads((tmp_path / "replied_posts.json").read_text(encoding='utf-8')) == {"old": "2026-01-02T10:39:24"}
+
+    def test_merge_is_deterministic(self, tmp_path):
+        """Test merge unions everything into sorted monthly base segments, earliest time winning."""
+        (tmp_path / "replied_posts.json").write_text(json.dumps({"b": "2026-01-03T00:00:00"}), encoding='utf-8')
+        segments = tmp_path / "replied_posts.d"
+        segments.mkdir()
+        (segments / "run-1.tsv").write_text("c\t2026-01-05T00:00:00\nb\t2026-01-01T00:00:00\n", encoding='utf-8')
+        (segments / "2026-01.run-2.tsv").write_text(
+            "a\t2026-01-04T00:00:00\nc\t2026-01-06T00:00:00\nd\t2026-02-01T00:00:00\n", encoding='utf-8'
+        )
+
+        assert _storage(tmp_path, "base").merge() == 4
+        assert sorted(os.listdir(segments)) == ["2026-01.base.tsv", "2026-02.base.tsv"]
+        assert not (tmp_path / "replied_posts.json").exists()
+        assert (segments / "2026-01.base.tsv").read_text(encoding='utf-8') == (
+            "a\t2026-01-04T00:00:00\nb\t2026-01-01T00:00:00\nc\t2026-01-05T00:00:00\n"
+        )
+        assert (segments / "2026-02.base.tsv").read_text(encoding='utf-8') == "d\t2026-02-01T00:00:00\n"
+
+
+class TestMonthShards:
+    """Tests for lazily loaded month segments."""
+
+    def _write_months(self, tmp_path):
+        segments = tmp_path / "replied_posts.d"
+        segments.mkdir()
+        (segments / "2026-03.base.tsv").write_text("march\t2026-03-10T00:00:00\n", encoding='utf-8')
+        (segments / "2026-09.base.tsv").write_text("september\t2026-09-10T00:00:00\n", encoding='utf-8')
+        (segments / "2026-10.run-x.tsv").write_text("october\t2026-10-10T00:00:00\n", encoding='utf-8')
+        (segments / "legacy.tsv").write_text("flat\t2025-01-01T00:00:00\n", encoding='utf-8')
+
+    def test_only_recent_months_loaded_eagerly(self, tmp_path):
+        """Test months outside the lookback horizon are not read at startup."""
+        self._write_months(tmp_path)
+        storage = _storage(tmp_path, "run-a")
+        assert set(storage.replied_posts) == {"september", "october", "flat"}
+
+    def test_miss_loads_only_months_the_post_could_be_replied_in(self, tmp_path):
+        """Test a recent post's miss does not open old months, an old post's miss does."""
+        self._write_months(tmp_path)
+        storage = _storage(tmp_path, "run-a")
+        assert not storage.is_replied("unknown", "2026-10-18T08:00:00.000Z")
+        assert "march" not in storage.replied_posts
+        assert storage.is_replied("march", "2026-03-09T08:00:00.000Z")
+
+    def test_miss_without_date_loads_everything(self, tmp_path):
+        """Test an unknown post date falls back to loading every month."""
+        self._write_months(tmp_path)
+        storage = _storage(tmp_path, "run-a")
+        assert storage.is_replied("march")
+
+    def test_writes_only_current_month(self, tmp_path):
+        """Test replies are appended to the current month's segment of this run."""
+        self._write_months(tmp_path)
+        storage = _storage(tmp_path, "run-a", lookback_months=1)
+        storage.mark_as_replied("new")
+        assert (tmp_path / "replied_posts.d" / "2026-10.run-a.tsv").read_text(encoding='utf-8').startswith("new\t")
+        assert "september" not in storage.replied_posts
+        assert set(storage.load_all()) == {"march", "september", "october", "flat", "new"}
+
+    def test_uncompacted_segments_exclude_bases(self, tmp_path):
+        """Test only run segments count towards the next merge."""
+        segments = tmp_path / "replied_posts.d"
+        segments.mkdir()
+        for name in ["base.tsv", "2026-01.base.tsv", "run-1.tsv", "2026-10.run-2.tsv"]:
+            (segments / name).write_text("", encoding='utf-8')
+        storage = _storage(tmp_path, "run-3")
+        assert [os.path.basename(p) for p in storage.uncompacted_segments()] == ["2026-10.run-2.tsv", "run-1.tsv"]
@@ -0,0 +1,43 @@
+"""
+Unit tests for listing snapshot diffing in list_subjects.py.
+"""
+from datetime import datetime, timedelta, timezone
+
+from list_subjects import classify, load_snapshot, save_snapshot
+
+
+def _record(convo_id, title="Title", date_posted=None):
+    if date_posted is None:
+        date_posted = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    return {
+        "conversationID": convo_id, "roomGUID": "room", "title": title, "content": "content",
+        "username": "user", "isLiked": False, "datePosted": date_posted, "room_title": "其他",
+    }
+
+
+class TestClassify:
+    """Tests for classify."""
+
+    def test_new_changed_unchanged(self):
+        record = _record("c1")
+        assert classify(record, None) == "new"
+        assert classify(record, dict(record)) is None
+        assert classify(record, dict(record, title="Old title")) == "changed"
+
+
+class TestSnapshot:
+    """Tests for snapshot persistence."""
+
+    def test_round_trip_and_retention(self, tmp_path):
+        """Test recent records survive a save/load and very old ones are dropped."""
+        path = str(tmp_path / "snapshot.jsonl")
+        old_date = (datetime.now(timezone.utc) - timedelta(days=90)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        save_snapshot(path, {"c1": _record("c1"), "c2": _record("c2", date_posted=old_date)})
+
+        snapshot = load_snapshot(path)
+        assert list(snapshot) == ["c1"]
+        assert snapshot["c1"] == _record("c1", date_posted=snapshot["c1"]["datePosted"])
+
+    def test_missing_snapshot(self, tmp_path):
+        """Test a missing snapshot is empty."""
+        assert load_snapshot(str(tmp_path / "none.jsonl")) == {}
@@ -0,0 +1,116 @@
+"""
+Unit tests for the durable reply outbox (outbox.py) and its delivery in main.py.
+"""
+import time
+
+import pytest
+
+from main import PacingDeferred, deliver
+from outbox import MAX_ATTEMPTS, STATE_DELAYED, STATE_POSTED, Outbox
+from pacing import ACTION_REPLY, PacingScheduler
+
+UNPACED = PacingScheduler(rates={}, jitter="none")
+
+
+class FakeClient:
+    command_url = "https://command.example.com"
+    username = "bot"
+
+    def __init__(self, reply_guid="new-guid", like_ok=True):
+        self.reply_guid = reply_guid
+        self.like_ok = like_ok
+        self.replies = []
+        self.likes = []
+
+    def reply_to_conversation(self, room_guid, post_guid, message):
+        self.replies.append((room_guid, post_guid, message))
+        return self.reply_guid
+
+    def like_conversation(self, conversation_guid):
+        self.likes.append(conversation_guid)
+        return self.like_ok
+
+
+class Recorder:
+    """Stands in for GitStorage / PostDeduper / ReplyHistory."""
+    def __init__(self):
+        self.calls = []
+
+    def mark_as_replied(self, *args):
+        self.calls.append(args)
+
+    remember = add = mark_as_replied
+
+
+class TestOutbox:
+    """Tests for Outbox persistence."""
+
+    def test_items_survive_reload(self, tmp_path):
+        """Test a generated reply is still pending after a restart."""
+        path = str(tmp_path / "outbox.json")
+        Outbox(path).add("c1", "room", "正！", "title", "content")
+        outbox = Outbox(path)
+        assert "c1" in outbox
+        assert outbox.pending()[0]['reply'] == "正！"
+
+    def test_item_dropped_after_max_attempts(self, tmp_path):
+        """Test an item that keeps failing is eventually given up."""
+        outbox = Outbox(str(tmp_path / "outbox.json"))
+        outbox.add("c1", "room", "正！")
+        for _ in range(MAX_ATTEMPTS):
+            outbox.record_failure("c1")
+        assert "c1" not in outbox
+
+
+class TestDeliver:
+    """Tests for resuming outbox items in main.deliver."""
+
+    def test_resume_delayed_item_posts_without_waiting_again(self, tmp_path):
+        """Test an item whose delay already elapsed is posted, liked and removed."""
+        outbox = Outbox(str(tmp_path / "outbox.json"))
+        outbox.add("c1", "room", "正！")
+        item = outbox.update("c1", state=STATE_DELAYED, delayed_until=0)
+        client, storage = FakeClient(), Recorder()
+
+        assert deliver(client, outbox, storage, Recorder(), Recorder(), UNPACED, item) is True
+        assert client.replies == [("room", "c1", "正！")]
+        assert client.likes == ["new-guid"]
+        assert storage.calls == [("c1",)]
+        assert "c1" not in outbox
+
+    def test_resume_posted_item_only_likes(self, tmp_path):
+        """Test an item posted before a crash is liked but never posted twice."""
+        outbox = Outbox(str(tmp_path / "outbox.json"))
+        outbox.add("c1", "room", "正！")
+        item = outbox.update("c1", state=STATE_POSTED, reply_guid="old-guid")
+        client = FakeClient()
+
+        deliver(client, outbox, Recorder(), Recorder(), Recorder(), UNPACED, item)
+        assert client.replies == []
+        assert client.likes == ["old-guid"]
+        assert "c1" not in outbox
+
+    def test_failed_reply_stays_pending(self, tmp_path):
+        """Test a failed reply stays in the outbox for the next run."""
+        outbox = Outbox(str(tmp_path / "outbox.json"))
+        outbox.add("c1", "room", "正！")
+        item = outbox.update("c1", state=STATE_DELAYED, delayed_until=0)
+
+        assert deliver(FakeClient(reply_guid=None), outbox, Recorder(), Recorder(), Recorder(), UNPACED, item) is False
+        assert outbox.items["c1"]['attempts'] == 1
+
+    def test_resumed_items_go_through_the_bucket(self, tmp_path):
+        """Test leftover items with past slots are paced, not posted back to back."""
+        outbox = Outbox(str(tmp_path / "outbox.json"))
+        for convo_id in ("c1", "c2"):
+            outbox.add(convo_id, "room", "正！")
+            outbox.update(convo_id, state=STATE_DELAYED, delayed_until=0)
+        pacer = PacingScheduler(rates={ACTION_REPLY: 60}, jitter="none", max_wait=30)
+        client = FakeClient()
+
+        assert deliver(client, outbox, Recorder(), Recorder(), Recorder(), pacer, outbox.items["c1"]) is True
+        with pytest.raises(PacingDeferred):
+            deliver(client, outbox, Recorder(), Recorder(), Recorder(), pacer, outbox.items["c2"])
+        assert [reply[1] for reply in client.replies] == ["c1"]
+        assert outbox.items["c2"]["state"] == STATE_DELAYED
+        assert outbox.items["c2"]["delayed_until"] > time.time() + 30
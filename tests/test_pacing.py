@@ -0,0 +1,120 @@
+"""
+Unit tests for the token-bucket pacing scheduler in pacing.py.
+"""
+from datetime import datetime
+
+from pacing import ACTION_LIKE, ACTION_REPLY, PacingScheduler, TokenBucket, parse_quiet_hours
+from utils import HK_TIMEZONE
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def _scheduler(clock, **kwargs):
+    kwargs.setdefault("rates", {ACTION_REPLY: 60, ACTION_LIKE: 360})
+    kwargs.setdefault("jitter", "none")
+    return PacingScheduler(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+class TestTokenBucket:
+    """Tests for TokenBucket reservations."""
+
+    def test_burst_then_rate(self):
+        """Test the burst is immediate and later sends follow the rate."""
+        bucket = TokenBucket(rate_per_hour=60, burst=2, now=0)
+        assert bucket.reserve(0) == 0
+        assert bucket.reserve(0) == 0
+        assert bucket.reserve(0) == 60
+        assert bucket.reserve(0) == 120
+
+    def test_idle_time_refills(self):
+        """Test tokens accumulate while idle, capped at the burst size."""
+        bucket = TokenBucket(rate_per_hour=60, burst=1, now=0)
+        bucket.reserve(0)
+        assert bucket.reserve(1000) == 1000
+
+
+class TestPacingScheduler:
+    """Tests for PacingScheduler."""
+
+    def test_total_time_tracks_rate(self):
+        """Test that N replies take (N - burst) rate intervals, not N worst-case delays."""
+        clock = FakeClock(0)
+        pacer = _scheduler(clock)
+        for _ in range(3):
+            pacer.wait(ACTION_REPLY)
+        assert clock.now == 120
+
+    def test_next_send_time_does_not_reserve(self):
+        """Test peeking at the next slot leaves it available."""
+        clock = FakeClock(0)
+        pacer = _scheduler(clock)
+        assert pacer.next_send_time(ACTION_REPLY) == 0
+        assert pacer.reserve(ACTION_REPLY) == 0
+        assert pacer.next_send_time(ACTION_REPLY) == 60
+
+    def test_actions_and_accounts_are_independent(self):
+        """Test replies, likes and accounts each have their own bucket."""
+        clock = FakeClock(0)
+        pacer = _scheduler(clock)
+        pacer.reserve(ACTION_REPLY, "a")
+        assert pacer.reserve(ACTION_LIKE, "a") == 0
+        assert pacer.reserve(ACTION_REPLY, "b") == 0
+
+    def test_unlimited_action(self):
+        """Test an action without a rate ceiling is never delayed."""
+        clock = FakeClock(0)
+        pacer = _scheduler(clock, rates={})
+        assert pacer.reserve(ACTION_REPLY) == 0
+        assert pacer.reserve(ACTION_REPLY) == 0
+
+    def test_custom_jitter(self):
+        """Test a pluggable jitter callable is added to reserved slots."""
+        clock = FakeClock(0)
+        pacer = _scheduler(clock, jitter=lambda scale: scale, jitter_scale=7)
+        assert pacer.reserve(ACTION_REPLY) == 7
+
+    def test_quiet_hours_postpone_send(self):
+        """Test a slot inside quiet hours moves to the end of the window (HK time)."""
+        start = datetime(2026, 1, 7, 2, 30, tzinfo=HK_TIMEZONE).timestamp()
+        clock = FakeClock(start)
+        pacer = _scheduler(clock, quiet_hours=(1, 7))
+        expected = datetime(2026, 1, 7, 7, 0, tzinfo=HK_TIMEZONE).timestamp()
+        assert pacer.reserve(ACTION_REPLY) == expected
+
+    def test_wait_refuses_slots_beyond_max_wait(self):
+        """Test a quiet-hours slot hours away is not slept through."""
+        start = datetime(2026, 1, 7, 2, 30, tzinfo=HK_TIMEZONE).timestamp()
+        clock = FakeClock(start)
+        pacer = _scheduler(clock, quiet_hours=(1, 7), max_wait=600)
+        assert pacer.too_far(pacer.next_send_time(ACTION_REPLY))
+        assert pacer.wait(ACTION_LIKE) is False
+        assert clock.now == start
+
+    def test_from_env_splits_rates_between_shards(self, monkeypatch):
+        """Test parallel shards share the per-account ceilings instead of multiplying them."""
+        monkeypatch.setenv("PACING_REPLIES_PER_HOUR", "30")
+        monkeypatch.setenv("PACING_LIKES_PER_HOUR", "60")
+        assert PacingScheduler.from_env().rates == {ACTION_REPLY: 30, ACTION_LIKE: 60}
+        assert PacingScheduler.from_env(share=3).rates == {ACTION_REPLY: 10, ACTION_LIKE: 20}
+
+
+class TestParseQuietHours:
+    """Tests for parse_quiet_hours."""
+
+    def test_valid_and_wrapping(self):
+        assert parse_quiet_hours("1-7") == (1, 7)
+        assert parse_quiet_hours("23-6") == (23, 6)
+
+    def test_invalid(self):
+        assert parse_quiet_hours("") is None
+        assert parse_quiet_hours("night") is None
+        assert parse_quiet_hours("5-5") is None
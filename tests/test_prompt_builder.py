@@ -0,0 +1,64 @@
+"""
+Unit tests for prompt token estimation and budgeting (prompt_builder.py).
+"""
+from prompt_builder import (
+    ELLIPSIS,
+    build_user_message,
+    estimate_tokens,
+    fit_to_budget,
+    split_sentences,
+)
+
+LONG_PROMO = (
+    "今日去咗銀行開戶。職員話要等兩星期！有冇人知點解咁耐？"
+    + "呢間分行好多人排隊，冷氣又唔夠凍。" * 20
+    + "最後我用咗app開戶，5分鐘搞掂。"
+)
+
+
+class TestEstimateTokens:
+    def test_cjk_counts_one_token_per_character(self):
+        assert estimate_tokens("你好嗎") == 3
+
+    def test_latin_counts_about_four_characters_per_token(self):
+        assert estimate_tokens("hello world!") == 3
+
+    def test_mixed_and_empty(self):
+        assert estimate_tokens("你好 hello") == 2 + 2
+        assert estimate_tokens("") == 0
+        assert estimate_tokens(None) == 0
+
+
+class TestSplitSentences:
+    def test_splits_on_cjk_punctuation_and_breaks(self):
+        assert split_sentences("第一句。第二句！<br>第三句\nFourth. Fifth?") == [
+            "第一句。", "第二句！", "第三句", "Fourth.", "Fifth?"
+        ]
+
+
+class TestFitToBudget:
+    def test_short_content_unchanged(self):
+        assert fit_to_budget("pls adv", 50) == "pls adv"
+
+    def test_long_content_fits_budget_and_keeps_key_sentences(self):
+        result = fit_to_budget(LONG_PROMO, 60, title="開戶要等幾耐")
+        assert estimate_tokens(result) <= 60 + 10  # separators are not budgeted exactly
+        assert result.startswith("今日去咗銀行開戶。")
+        assert "有冇人知點解咁耐？" in result
+        assert "5分鐘搞掂" in result
+        assert ELLIPSIS in result
+
+    def test_single_oversized_sentence_is_truncated(self):
+        result = fit_to_budget("a" * 1000, 20)
+        assert result.endswith(ELLIPSIS)
+        assert estimate_tokens(result) <= 20
+
+
+class TestBuildUserMessage:
+    def test_title_kept_whole(self):
+        message = build_user_message(LONG_PROMO, "開戶要等幾耐", budget=80)
+        assert message.startswith("帖子標題：開戶要等幾耐\n帖子內容：今日去咗銀行開戶。")
+        assert estimate_tokens(message) < estimate_tokens(LONG_PROMO)
+
+    def test_without_title(self):
+        assert build_user_message("pls adv", "") == "帖子內容：pls adv\n\n請生成回覆："
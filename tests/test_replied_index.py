@@ -0,0 +1,139 @@
+"""
+Unit tests for the binary replied-posts index in replied_index.py.
+"""
+import json
+import os
+import uuid
+
+from replied_index import DELTA_SUFFIX, RECORD, BinaryReplyStorage, convert_git_storage, merge_files, write_index
+
+
+def _ids(n):
+    return [str(uuid.uuid4()) for _ in range(n)]
+
+
+class TestBinaryReplyStorage:
+    """Tests for BinaryReplyStorage lookups and inserts."""
+
+    def test_fresh_storage(self, tmp_path):
+        """Test a missing file behaves like an empty history."""
+        storage = BinaryReplyStorage(str(tmp_path / "replied.bin"))
+        assert len(storage) == 0
+        assert storage.is_replied(str(uuid.uuid4())) is False
+
+    def test_mark_and_reload(self, tmp_path):
+        """Test marked posts are found after reopening, in any insert order."""
+        path = str(tmp_path / "replied.bin")
+        ids = _ids(50)
+        storage = BinaryReplyStorage(path)
+        for post_id in ids:
+            storage.mark_as_replied(post_id)
+        storage.mark_as_replied(ids[0])
+
+        reopened = BinaryReplyStorage(path)
+        assert len(reopened) == 50
+        assert all(reopened.is_replied(post_id) for post_id in ids)
+        assert all(reopened.is_replied(post_id.upper()) for post_id in ids[:3])
+        assert not any(reopened.is_replied(post_id) for post_id in _ids(50))
+
+    def test_bloom_grows_past_capacity(self, tmp_path):
+        """Test inserts beyond the initial Bloom capacity are still found."""
+        path = str(tmp_path / "replied.bin")
+        ids = _ids(3)
+        write_index(path, [(uuid.UUID(i).bytes, 0) for i in ids])
+        storage = BinaryReplyStorage(path)
+        extra = _ids(1200)
+        for post_id in extra:
+            storage.mark_as_replied(post_id)
+        storage.flush()
+        assert all(storage.is_replied(post_id) for post_id in ids + extra)
+        assert all(BinaryReplyStorage(path).is_replied(post_id) for post_id in ids + extra)
+
+    def test_marking_never_rewrites_the_index(self, tmp_path):
+        """Test replies go to the delta file and are merged into the index only by flush()."""
+        path = str(tmp_path / "replied.bin")
+        ids = _ids(3)
+        write_index(path, [(uuid.UUID(i).bytes, 0) for i in ids])
+        size = os.path.getsize(path)
+        storage = BinaryReplyStorage(path)
+        new = _ids(2)
+        for post_id in new:
+            storage.mark_as_replied(post_id)
+        assert os.path.getsize(path) == size
+        assert os.path.getsize(path + DELTA_SUFFIX) == 2 * RECORD.size
+
+        # A run that stopped before flushing still counts its replies next time
+        reopened = BinaryReplyStorage(path)
+        assert len(reopened) == 5
+        assert all(reopened.is_replied(post_id) for post_id in ids + new)
+
+        reopened.flush()
+        assert os.path.getsize(path + DELTA_SUFFIX) == 0
+        flushed = BinaryReplyStorage(path)
+        assert flushed._count == 5
+        assert all(flushed.is_replied(post_id) for post_id in ids + new)
+
+    def test_torn_delta_record_ignored(self, tmp_path):
+        """Test a partial record at the end of the delta (crash mid-write) is skipped and overwritten."""
+        path = str(tmp_path / "replied.bin")
+        first, second = _ids(2)
+        storage = BinaryReplyStorage(path)
+        storage.mark_as_replied(first)
+        with open(path + DELTA_SUFFIX, 'ab') as f:
+            f.write(b"torn")
+        storage = BinaryReplyStorage(path)
+        assert storage.is_replied(first)
+        storage.mark_as_replied(second)
+        assert all(BinaryReplyStorage(path).is_replied(post_id) for post_id in (first, second))
+
+    def test_non_uuid_ids_kept_in_memory(self, tmp_path):
+        """Test non-UUID ids are remembered for the run only."""
+        path = str(tmp_path / "replied.bin")
+        storage = BinaryReplyStorage(path)
+        storage.mark_as_replied("convo_101")
+        assert storage.is_replied("convo_101")
+        assert not BinaryReplyStorage(path).is_replied("convo_101")
+
+
+class TestMergeFiles:
+    """Tests for the git merge driver of the index and delta files."""
+
+    def test_union_of_two_indexes(self, tmp_path):
+        """Test two runs' indexes merge into one holding every replied ID."""
+        ids = _ids(4)
+        ours, theirs = str(tmp_path / "ours.bin"), str(tmp_path / "theirs.bin")
+        write_index(ours, [(uuid.UUID(i).bytes, 0) for i in ids[:3]])
+        write_index(theirs, [(uuid.UUID(i).bytes, 0) for i in ids[1:]])
+        merge_files(ours, theirs)
+        storage = BinaryReplyStorage(ours)
+        assert len(storage) == 4
+        assert all(storage.is_replied(i) for i in ids)
+
+    def test_union_of_two_deltas(self, tmp_path):
+        """Test delta files stay deltas and keep both sides' records."""
+        first, second = _ids(2)
+        for name, post_id in (("ours", first), ("theirs", second)):
+            BinaryReplyStorage(str(tmp_path / f"{name}.bin")).mark_as_replied(post_id)
+        ours = str(tmp_path / "ours.bin") + DELTA_SUFFIX
+        merge_files(ours, str(tmp_path / "theirs.bin") + DELTA_SUFFIX)
+        assert os.path.getsize(ours) == 2 * RECORD.size
+        storage = BinaryReplyStorage(str(tmp_path / "ours.bin"))
+        assert storage.is_replied(first) and storage.is_replied(second)
+
+
+class TestConvertGitStorage:
+    """Tests for converting the GitStorage history."""
+
+    def test_convert(self, tmp_path):
+        """Test all UUID entries of the JSON history and segments are carried over."""
+        ids = _ids(10)
+        source = tmp_path / "replied.json"
+        source.write_text(json.dumps({i: "2026-01-02T10:39:24.575103" for i in ids[:5]}), encoding='utf-8')
+        segments = tmp_path / "replied.d"
+        segments.mkdir()
+        (segments / "run-1.tsv").write_text("".join(f"{i}\t2026-01-03T00:00:00\n" for i in ids[5:]), encoding='utf-8')
+        target = str(tmp_path / "replied.bin")
+
+        assert convert_git_storage(target, str(source), str(segments)) == 10
+        storage = BinaryReplyStorage(target)
+        assert all(storage.is_replied(i) for i in ids)
@@ -0,0 +1,43 @@
+"""
+Unit tests for room sharding in main.py.
+"""
+import uuid
+
+from main import room_shard, shard_suffix
+
+
+class TestRoomShard:
+    """Tests for room_shard."""
+
+    def test_stable_across_calls(self):
+        """Test a room always maps to the same shard (no per-process hash seed)."""
+        room_guid = "0db44910-69d3-4684-94d6-842a80895ba8"
+        assert room_shard(room_guid, 3) == 1
+        assert room_shard(room_guid, 1) == 0
+
+    def test_partition_covers_every_room_once(self):
+        """Test every room lands in exactly one shard within range."""
+        rooms = [str(uuid.uuid4()) for _ in range(60)]
+        shards = {index: [r for r in rooms if room_shard(r, 3) == index] for index in range(3)}
+        assert sorted(sum(shards.values(), [])) == sorted(rooms)
+        assert all(shards.values())
+
+
+class TestShardSuffix:
+    """Tests for shard_suffix."""
+
+    def test_hash_shards_use_their_index(self):
+        """Test hash shards get one file name per index."""
+        assert shard_suffix(0) == "shard0"
+        assert shard_suffix(2) == "shard2"
+
+    def test_room_subsets_get_distinct_names(self):
+        """Test explicit subsets differ even when every job has the default SHARD_INDEX."""
+        first = shard_suffix(0, ["Room A", "Room B"])
+        second = shard_suffix(0, ["Room C"])
+        assert first != second
+        assert first.startswith("rooms-") and first != "shard0"
+
+    def test_room_subset_order_does_not_matter(self):
+        """Test the same subset always maps to the same files."""
+        assert shard_suffix(0, ["Room B", "Room A"]) == shard_suffix(1, ["Room A", "Room B"])
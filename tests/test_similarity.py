@@ -0,0 +1,141 @@
+"""
+Unit tests for shingling/MinHash in similarity.py and its users (post de-duplication, reply history).
+"""
+from similarity import MinHashIndex, estimate_similarity, minhash_signature, normalize_text, shingles
+from post_dedupe import PostDeduper, vary_reply
+from reply_history import ReplyHistory, tail_lines
+
+
+def _sig(text):
+    return minhash_signature(shingles(text))
+
+
+class TestNormalizeAndShingles:
+    """Tests for normalize_text and shingles."""
+
+    def test_punctuation_and_width_ignored(self):
+        """Test that full-width punctuation, spaces and <br> do not affect normalization."""
+        assert normalize_text("同意，正！") == normalize_text("同意 正!<br>")
+
+    def test_cjk_shingles(self):
+        """Test character shingles for CJK text without word boundaries."""
+        assert shingles("信用卡優惠") == {"信用卡", "用卡優", "卡優惠"}
+
+    def test_short_text_single_shingle(self):
+        """Test that text shorter than the shingle size is one shingle."""
+        assert shingles("正!") == {"正"}
+
+    def test_empty_text(self):
+        """Test that empty text has no shingles."""
+        assert shingles("") == set()
+
+
+class TestMinHashIndex:
+    """Tests for MinHash signatures and the LSH index."""
+
+    def test_identical_texts_fully_similar(self):
+        """Test identical texts have similarity 1.0."""
+        assert estimate_similarity(_sig("今日滙豐App有新優惠"), _sig("今日滙豐App有新優惠")) == 1.0
+
+    def test_near_duplicate_found(self):
+        """Test a repost with small edits is returned by the index."""
+        index = MinHashIndex()
+        index.add("a", _sig("【限時優惠】用滙豐信用卡喺超市簽賬滿$500即享$50回贈，快啲去睇下！"))
+        index.add("b", _sig("有冇人知道點樣開通網上理財戶口？"))
+        match = index.query(_sig("【限時優惠】用滙豐信用卡喺超市簽賬滿$500即享$50回贈，快啲去睇下!!"), 0.8)
+        assert match is not None
+        assert match[0] == "a"
+
+    def test_unrelated_text_not_found(self):
+        """Test unrelated text does not match."""
+        index = MinHashIndex()
+        index.add("a", _sig("【限時優惠】用滙豐信用卡喺超市簽賬滿$500即享$50回贈"))
+        assert index.query(_sig("有冇人知道點樣開通網上理財戶口？"), 0.8) is None
+
+    def test_remove(self):
+        """Test removed keys are no longer returned."""
+        index = MinHashIndex()
+        index.add("a", _sig("同意，正！"))
+        index.remove("a")
+        assert len(index) == 0
+        assert index.query(_sig("同意，正！"), 0.5) is None
+
+
+class TestPostDeduper:
+    """Tests for PostDeduper policies and persistence."""
+
+    def test_skip_policy_across_runs(self, tmp_path):
+        """Test a duplicate seen in a previous run is skipped."""
+        path = str(tmp_path / "seen.json")
+        PostDeduper(path).remember("p1", "信用卡優惠", "超市簽賬滿$500即享$50回贈", "正！")
+        action, cached = PostDeduper(path).check("p2", "信用卡優惠", "超市簽賬滿$500即享$50回贈")
+        assert action == "skip"
+        assert cached == "正！"
+
+    def test_vary_without_cached_reply_processes(self, tmp_path):
+        """Test "vary" falls back to processing when no reply was cached."""
+        deduper = PostDeduper(str(tmp_path / "seen.json"), policy="vary")
+        deduper.remember("p1", "pls adv", "邊張卡好")
+        assert deduper.check("p2", "pls adv", "邊張卡好")[0] == "process"
+
+    def test_same_post_is_not_its_own_duplicate(self, tmp_path):
+        """Test a post is never flagged as a duplicate of itself."""
+        deduper = PostDeduper(str(tmp_path / "seen.json"))
+        deduper.remember("p1", "pls adv", "邊張卡好")
+        assert deduper.check("p1", "pls adv", "邊張卡好")[0] == "process"
+
+    def test_vary_reply_changes_ending(self):
+        """Test vary_reply keeps the body and changes the ending."""
+        varied = vary_reply("同意呀")
+        assert varied.startswith("同意")
+        assert varied != "同意呀"
+
+    def test_vary_reply_never_adds_particle_after_punctuation(self):
+        """Test the reply's own closing punctuation is replaced, not followed by a particle."""
+        for reply in ["同意，正！", "好似唔錯。", "真係？？"]:
+            for _ in range(50):
+                varied = vary_reply(reply)
+                assert varied != reply
+                assert not any(f"{mark}{particle}" in varied for mark in "。！？!?" for particle in "啦呀喎")
+
+
+class TestReplyHistory:
+    """Tests for ReplyHistory repetition detection."""
+
+    def test_repeated_stock_reply_flagged_after_reload(self, tmp_path):
+        """Test a stock reply posted in an earlier run is flagged."""
+        path = str(tmp_path / "history.jsonl")
+        ReplyHistory(path).add("c1", "同意，正！")
+        similar = ReplyHistory(path).find_similar("同意 正!!")
+        assert similar is not None
+        assert similar[0] == "c1"
+
+    def test_different_reply_not_flagged(self, tmp_path):
+        """Test an unrelated reply passes."""
+        history = ReplyHistory(str(tmp_path / "history.jsonl"))
+        history.add("c1", "同意，正！")
+        assert history.find_similar("呢張卡年費貴咗啲，不過回贈都唔錯") is None
+
+    def test_window_evicts_old_replies(self, tmp_path):
+        """Test only the most recent replies are indexed."""
+        history = ReplyHistory(str(tmp_path / "history.jsonl"), window=1)
+        history.add("c1", "同意，正！")
+        history.add("c2", "呢張卡年費貴咗啲，不過回贈都唔錯")
+        assert history.find_similar("同意，正！") is None
+
+    def test_only_recent_window_is_read(self, tmp_path):
+        """Test startup reads just the tail of the history (older lines are never parsed)."""
+        path = tmp_path / "history.jsonl"
+        path.write_text("not json at all\n", encoding='utf-8')
+        writer = ReplyHistory(str(path), window=2)
+        for i, reply in enumerate(["同意，正！", "呢張卡年費貴咗啲", "回贈都唔錯喎"]):
+            writer.add(f"c{i}", reply)
+        history = ReplyHistory(str(path), window=2)
+        assert sorted(cid for cid, _ in history._replies.values()) == ["c1", "c2"]
+
+    def test_tail_lines_across_blocks(self, tmp_path):
+        """Test the backwards scan joins lines split over block boundaries."""
+        path = tmp_path / "lines.txt"
+        path.write_text("".join(f"line-{i}\n" for i in range(100)) + "\n", encoding='utf-8')
+        assert tail_lines(str(path), 3, block_size=5) == ["line-97", "line-98", "line-99"]
+        assert tail_lines(str(path), 500, block_size=7) == [f"line-{i}" for i in range(100)]
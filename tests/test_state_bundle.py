@@ -0,0 +1,148 @@
+"""
+Unit tests for the warm-start state bundle (state_bundle.py) and the state it caches.
+"""
+import json
+import os
+import time
+
+from forum_client import Conversation, ForumClient
+from main import STATE_FILES, after_cursor
+from state_bundle import BUNDLE_VERSION, StateBundle
+
+
+def _conversation(conversation_id, date_posted):
+    return Conversation(conversation_id, "room", "content", "title", "user", False, date_posted)
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _bundle(tmp_path, clock):
+    return StateBundle(str(tmp_path / "state_bundle.json"), token_ttl=900, metadata_ttl=3600, clock=clock)
+
+
+class TestStateBundle:
+    """Tests for StateBundle persistence and TTLs."""
+
+    def test_round_trip(self, tmp_path):
+        """Test everything written is read back by the next run."""
+        clock = FakeClock()
+        bundle = _bundle(tmp_path, clock)
+        bundle.set_token("tok")
+        bundle.set_metadata("page", {"pageGUID": "p1"})
+        bundle.set_cursor("room", "2026-01-07T15:04:51.870Z")
+        bundle.save()
+
+        reloaded = _bundle(tmp_path, clock)
+        assert reloaded.token == "tok"
+        assert reloaded.token_recently_validated()
+        assert reloaded.get_metadata("page") == {"pageGUID": "p1"}
+        assert reloaded.get_cursor("room") == "2026-01-07T15:04:51.870Z"
+        assert not (tmp_path / "state_bundle.json.tmp").exists()
+
+    def test_ttls_expire(self, tmp_path):
+        """Test stale tokens and metadata are not trusted."""
+        clock = FakeClock()
+        bundle = _bundle(tmp_path, clock)
+        bundle.set_token("tok")
+        bundle.set_metadata("page", {"pageGUID": "p1"})
+        clock.now += 1000
+        assert not bundle.token_recently_validated()
+        assert bundle.get_metadata("page") == {"pageGUID": "p1"}
+        clock.now += 3000
+        assert bundle.get_metadata("page") is None
+
+    def test_cursor_only_moves_forward(self, tmp_path):
+        """Test an older post date never rewinds the cursor."""
+        bundle = _bundle(tmp_path, FakeClock())
+        bundle.set_cursor("room", "2026-01-07T00:00:00Z")
+        bundle.set_cursor("room", "2026-01-01T00:00:00Z")
+        bundle.set_cursor("room", None)
+        assert bundle.get_cursor("room") == "2026-01-07T00:00:00Z"
+
+    def test_other_version_or_corrupt_file_is_cold_start(self, tmp_path):
+        """Test an unusable bundle is ignored."""
+        path = tmp_path / "state_bundle.json"
+        path.write_text(json.dumps({"version": BUNDLE_VERSION + 1, "auth": {"token": "old"}}), encoding='utf-8')
+        assert _bundle(tmp_path, FakeClock()).token is None
+        path.write_text("{not json", encoding='utf-8')
+        assert _bundle(tmp_path, FakeClock()).token is None
+
+    def test_in_memory_bundle_never_saved(self, tmp_path, monkeypatch):
+        """Test a bundle without a file (cassette replay) writes nothing."""
+        monkeypatch.chdir(tmp_path)
+        bundle = StateBundle(None)
+        bundle.set_token("tok")
+        bundle.save()
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestWarmStart:
+    """Tests for the state the bundle lets a run skip."""
+
+    def test_recently_validated_token_skips_request(self, tmp_path, monkeypatch):
+        """Test a warm start does not call the validation endpoint."""
+        monkeypatch.chdir(tmp_path)
+        state = _bundle(tmp_path, FakeClock())
+        state.set_token("tok")
+        client = ForumClient("https://forum.example.com", "user", "pw", state=state)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("unexpected request")
+        monkeypatch.setattr(client, "_request", fail)
+
+        assert client.token == "tok"
+        assert client.validate_session()
+        assert not (tmp_path / "config.json").exists()
+
+    def test_cursor_skips_posts_handled_by_earlier_runs(self):
+        """Test only posts newer than the cursor (or without a date) are looked at again."""
+        conversations = [
+            _conversation("old", "2026-01-01T00:00:00Z"),
+            _conversation("same", "2026-01-07T00:00:00Z"),
+            _conversation("new", "2026-01-08T00:00:00Z"),
+            _conversation("undated", None),
+        ]
+        kept = after_cursor(conversations, "2026-01-07T00:00:00Z")
+        assert [c.conversation_id for c in kept] == ["new", "undated"]
+
+    def test_replay_uses_bundle_recorded_with_the_cassette(self, tmp_path, monkeypatch):
+        """Test a warm recording replays warm, hours later, without touching the real bundle."""
+        import cassette as cassette_module
+        from cassette import Cassette
+
+        monkeypatch.chdir(tmp_path)
+        recording = _bundle(tmp_path, FakeClock(time.time()))
+        recording.set_token("tok")
+        recording.set_metadata("page", {"pageGUID": "p1"})
+        recording.set_cursor("room", "2026-01-07T00:00:00Z")
+        recording.save()
+
+        monkeypatch.setattr(cassette_module, "get_cassette", lambda: Cassette("c.jsonl", "record"))
+        assert cassette_module.state_dir(STATE_FILES) == "."
+
+        # The real bundle moves on and the replay happens long after the TTLs expired
+        (tmp_path / "state_bundle.json").write_text("{}", encoding='utf-8')
+        monkeypatch.setattr(cassette_module, "get_cassette", lambda: Cassette("c.jsonl", "replay"))
+        data_dir = cassette_module.state_dir(STATE_FILES)
+        clock = cassette_module.state_clock()
+        monkeypatch.setattr(time, "time", lambda: clock() + 24 * 3600)
+        state = StateBundle(os.path.join(data_dir, "state_bundle.json"), token_ttl=900, metadata_ttl=3600,
+                            clock=cassette_module.state_clock())
+
+        client = ForumClient("https://forum.example.com", "user", "pw", state=state)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("unexpected request")
+        monkeypatch.setattr(client, "_request", fail)
+
+        assert client.validate_session()
+        assert state.get_metadata("page") == {"pageGUID": "p1"}
+        assert state.get_cursor("room") == "2026-01-07T00:00:00Z"
+        state.save()
+        assert (tmp_path / "state_bundle.json").read_text(encoding='utf-8') == "{}"
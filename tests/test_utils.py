@@ -3,7 +3,7 @@ Unit tests for date/time utility functions in utils.py.
 """
 import pytest
 from datetime import datetime, timezone, timedelta
-from utils import parse_iso_date, format_hk_time, is_within_hours, HK_TIMEZONE
+from utils import parse_iso_date, format_hk_time, is_within_hours, parse_room_titles, HK_TIMEZONE, DEFAULT_ROOM_TITLES
 
 
 class TestParseIsoDate:
@@ -154,3 +154,16 @@ class TestHkTimezone:
         utc_time = datetime(2026, 1, 7, 12, 0, 0, tzinfo=timezone.utc)
         hk_time = utc_time.astimezone(HK_TIMEZONE)
         assert hk_time.hour == 20  # 12 UTC + 8 = 20 HKT
+
+
+class TestParseRoomTitles:
+    """Tests for parse_room_titles function."""
+
+    def test_trims_and_drops_empty(self):
+        """Test whitespace is trimmed and empty entries are dropped."""
+        assert parse_room_titles(" 精明消費 , ,其他") == ["精明消費", "其他"]
+
+    def test_empty_uses_default(self):
+        """Test empty or missing values fall back to the default rooms."""
+        assert parse_room_titles("  ") == DEFAULT_ROOM_TITLES.split(",")
+        assert parse_room_titles(None) == DEFAULT_ROOM_TITLES.split(",")
@@ -30,6 +30,21 @@ def get_random_headers():
         "Referer": "https://www.google.com/"
     }
 
+# Default room titles when ROOM_TITLES is unset or empty
+DEFAULT_ROOM_TITLES = "精明消費,理財有道,環球智庫,加點保障,靈活信貸,其他"
+
+
+def parse_room_titles(room_titles_str):
+    """
+    Parse a comma-separated ROOM_TITLES value into a list of titles.
+
+    Whitespace around each title is trimmed; empty or missing values fall back to DEFAULT_ROOM_TITLES.
+    """
+    if not room_titles_str or not room_titles_str.strip():
+        room_titles_str = DEFAULT_ROOM_TITLES
+    return [title.strip() for title in room_titles_str.split(",") if title.strip()]
+
+
 def human_delay(max_seconds=300):
     """Wait for a random amount of time to mimic human behavior."""
     delay = random.uniform(5, max_seconds)